@@ -0,0 +1,163 @@
+import argparse
+import json
+import re
+import sys
+import time
+
+from booking_errors import _parse_error
+
+# The notebook's patterns, kept to check the scanning parser against them
+REFERENCE_CAPTURE_PATTERN = re.compile(r"```((?:.|\n)+)```")
+REFERENCE_TRUNCATED_PATTERN = re.compile(r"({(?:.|\n)+?})")
+
+HEADER = "*Booking Type:* Flight\n*Booking ID:* ABC123\n*Provider:* sabre\n"
+# Where the scanner decodes whole top level objects and the notebook decoded
+# from each { to the first } after it, so they pick different objects
+EXPECTED_DIFFERENCES = {
+    "truncated, nested field": "scanner reads an error with a nested object, reference stops at its first }",
+    "truncated, nested error": "reference finds the error nested in a wrapper object, scanner only takes top level objects",
+}
+
+
+def _get_args():
+    parser = argparse.ArgumentParser(
+        description="Time paper trail parsing on long and truncated booking failure messages"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[2_000, 8_000, 32_000],
+        help="Approximate message sizes in characters",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Parses per message, best one counts"
+    )
+    return parser.parse_args()
+
+
+def reference_parse_error(message):
+    try:
+        match = REFERENCE_CAPTURE_PATTERN.search(message["text"]).group(1)
+    except AttributeError:
+        for candidate in REFERENCE_TRUNCATED_PATTERN.finditer(message["text"]):
+            try:
+                error = json.loads(candidate.group(1))
+                return {"error_class": error["class"], "error_key": error["key"]}
+            except ValueError:
+                continue
+        raise ValueError("Did not find an error")
+    message_json = json.loads(match)
+    if len(message_json) == 1 or message_json[0].get("class") == "car-error":
+        important_error = message_json[0]
+    else:
+        important_error = message_json[1]
+    return {
+        "error_class": important_error["class"],
+        "error_key": important_error["key"],
+    }
+
+
+def _errors(size):
+    errors = []
+    while len(json.dumps(errors)) < size:
+        errors.append(
+            {
+                "class": "ProviderError",
+                "key": f"SEGMENT_{len(errors)}_UNAVAILABLE",
+                "message": "Segment could not be sold " * 4,
+            }
+        )
+    return errors
+
+
+def messages(size):
+    # (name, message) from well formed to the worst case for the old patterns
+    paper_trail = json.dumps(_errors(size))
+    return [
+        ("complete", {"text": f"{HEADER}```{paper_trail}```"}),
+        ("truncated", {"text": f"{HEADER}```{paper_trail[: size // 2]}"}),
+        (
+            # An unmatched quote before the fence must not hide the errors
+            "truncated, quote",
+            {"text": f'{HEADER}*Note:* said "hi\n```{paper_trail[: size // 2]}'},
+        ),
+        (
+            # Nothing before the cut off error ever closes
+            "truncated, unclosed",
+            {"text": f"{HEADER}```[" + '{"class": "ProviderError", ' * (size // 27)},
+        ),
+        (
+            "truncated, no error",
+            {"text": f"{HEADER}```" + "{ " * (size // 2) + "}"},
+        ),
+        (
+            # Every object closes but none is json or has a class
+            "no error, balanced",
+            {"text": f"{HEADER}```" + "{ " * (size // 4) + "}" * (size // 4)},
+        ),
+        (
+            "no error, class",
+            {"text": f"{HEADER}```" + '{"class": x} ' * (size // 13)},
+        ),
+        (
+            # The worst case, every object has to be decoded to find out
+            "no error, class and key",
+            {"text": f"{HEADER}```" + '{"class": x, "key": y} ' * (size // 23)},
+        ),
+        (
+            "truncated, nested field",
+            {
+                "text": f"{HEADER}```"
+                + '[{"class": "PaymentError", "key": "DECLINED", "detail": {"code": 5}}, '
+                + paper_trail[: size // 2]
+            },
+        ),
+        (
+            "truncated, nested error",
+            {
+                "text": f"{HEADER}```"
+                + '[{"context": {"id": 1}, "cause": {"class": "PaymentError", "key": "DECLINED"}}, '
+                + paper_trail[: size // 2]
+            },
+        ),
+    ]
+
+
+def _time(parse, message, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            result = parse(message)
+        except ValueError:
+            result = None
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    args = _get_args()
+    print(f"{'message':<26}{'chars':>8}{'reference':>12}{'scanning':>12}{'speedup':>9}")
+    for size in args.sizes:
+        for name, message in messages(size):
+            reference_elapsed, expected = _time(
+                reference_parse_error, message, args.repeat
+            )
+            elapsed, result = _time(_parse_error, message, args.repeat)
+            if (result != expected) != (name in EXPECTED_DIFFERENCES):
+                print(f"{name}: scanning parsed {result}, reference {expected}")
+                return 1
+            print(
+                f"{name:<26}{len(message['text']):>8}"
+                f"{reference_elapsed * 1000:>10.2f}ms{elapsed * 1000:>10.2f}ms"
+                f"{reference_elapsed / elapsed:>8.1f}x"
+            )
+    for name, difference in EXPECTED_DIFFERENCES.items():
+        print(f"{name}: {difference}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,350 @@
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+from datetime import datetime, timezone
+
+import pandas as pd  # type: ignore
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "slack_exporter")
+)
+from slack_archive import iter_messages  # noqa: E402
+
+PAPER_TRAIL_FENCE = "```"
+# A json string, quotes excluded
+JSON_STRING_BODY = r'[^"\\]*(?:\\.[^"\\]*)*'
+# Everything up to and including the next { or } that isn't inside a string or
+# escaped, or else the rest of the text. A string that is never closed runs to
+# the end
+JSON_BRACE_PATTERN = re.compile(
+    r'[^{}"\\]*(?:(?:"%s"|\\.)[^{}"\\]*)*(?:([{}])|(?:"%s)?\\?\Z)'
+    % (JSON_STRING_BODY, JSON_STRING_BODY),
+    re.DOTALL,
+)
+ERROR_CLASS_KEY = '"class"'
+ERROR_KEY_KEY = '"key"'
+BOOKING_TYPE_PATTERN = re.compile(r"\*Booking Type:\*\s+(\w+)\b")
+BOOKING_ID_PATTERN = re.compile(r"\*Booking ID:\*\s+(\w+)\b")
+PROVIDER_PATTERN = re.compile(r"\*Provider:\*\s+(\w+)\b")
+
+# Friday, November 22, 2019, where the original analysis starts
+DEFAULT_SINCE = 1574380800
+BOOKING_TYPES = ["Flight", "Hotel", "Car"]
+# Everything counted is grouped by these, stored as categoricals
+CATEGORICAL_COLUMNS = ["status", "provider", "booking_type", "error_class", "error_key"]
+
+PAYMENT_ERROR_CLASSES = {"PaymentError", "PaymentValidationError"}
+
+AMERICAN_EXPRESS = "AX"
+DINERS_CLUB = "DC"
+DISCOVER = "DS"
+MASTERCARD = "CA"
+VISA = "VI"
+JCB = "JC"
+LOLA = "LOLA"  # used for wombat 'other' card for manual imports
+
+PAYMENT_SUB_TYPE_TO_NAME = {
+    "AX": "AMERICAN_EXPRESS",
+    "DC": "DINERS_CLUB",
+    "DS": "DISCOVER",
+    "CA": "MASTERCARD",
+    "VI": "VISA",
+    "JC": "JCB",
+    "LOLA": "LOLA",
+}
+
+
+def _paper_trail(text):
+    # Everything between the first and the last fence, same as ```(.+)``` would
+    # match but found with two scans instead of backtracking
+    start = text.find(PAPER_TRAIL_FENCE)
+    end = text.rfind(PAPER_TRAIL_FENCE)
+    if start == -1 or end <= start + len(PAPER_TRAIL_FENCE):
+        return None
+    return text[start + len(PAPER_TRAIL_FENCE) : end]
+
+
+def _complete_objects(text, offset=0):
+    # (start, end) of every outermost {...} from offset on that gets closed, in
+    # one scan that stops at braces only. Stops once more objects are open than
+    # there are } left to close them, nothing after that can complete
+    depth, start = 0, None
+    closing = text.count("}", offset)
+    for match in JSON_BRACE_PATTERN.finditer(text, offset):
+        brace = match.group(1)
+        if brace is None:
+            return
+        closing -= match.group().count("}")
+        if brace == "{":
+            if depth == 0:
+                start = match.end() - 1
+            depth += 1
+            if depth > closing:
+                return
+        elif depth:
+            depth -= 1
+            if depth == 0:
+                yield start, match.end()
+
+
+def _handle_truncated_pattern(text):
+    # We have a truncated message. Try to get something reasonable out of it
+    # Decode the first complete error object I can find. Initial looking suggests the second error is the useful one
+    # Quotes are only tracked from the fence on, one in the header (e.g. a
+    # quoted customer comment) would otherwise put the whole trail in a string
+    offset = max(text.find(PAPER_TRAIL_FENCE), 0)
+    # An error has "class" and "key" keys. Objects without both aren't decoded
+    # and once either is gone from the rest there is nothing left to find
+    class_position = text.find(ERROR_CLASS_KEY, offset)
+    key_position = text.find(ERROR_KEY_KEY, offset)
+    if class_position == -1 or key_position == -1:
+        raise ValueError("Did not find an error")
+    for start, end in _complete_objects(text, offset):
+        if class_position < start:
+            class_position = text.find(ERROR_CLASS_KEY, start)
+        if key_position < start:
+            key_position = text.find(ERROR_KEY_KEY, start)
+        if class_position == -1 or key_position == -1:
+            break
+        if class_position >= end or key_position >= end:
+            continue
+        try:
+            error = json.loads(text[start:end])
+        except ValueError:
+            # Did not match
+            continue
+        if isinstance(error, dict) and "class" in error and "key" in error:
+            return {"error_class": error["class"], "error_key": error["key"]}
+    raise ValueError("Did not find an error")
+
+
+def _parse_error(message):
+    match = _paper_trail(message["text"])
+    if match is None:
+        # No closing fence which best I can tell happens when the message was truncated
+        return _handle_truncated_pattern(message["text"])
+    message_json = json.loads(match)
+
+    # magic! Im simplifying by focusing on only one of many errors that get reported at once. In general
+    # these are based on inspection... but if you are here skeptical. then this is where
+    # to start looking.
+    if len(message_json) == 1 or message_json[0].get("class") == "car-error":
+        important_error = message_json[0]
+    else:
+        important_error = message_json[1]
+    return {
+        "error_class": important_error["class"],
+        "error_key": important_error["key"],
+    }
+
+
+def _extract_criticality(message):
+    if message.get("username") == "Booking Failures [Critical]":
+        return "Critical"
+    elif message.get("username") == "Booking Failures [Non-Critical]":
+        return "Non-Critical"
+    else:
+        return "Unclassified"
+
+
+def extract_error_details(message):
+    message_attachment = message["attachments"][0]
+    text = message_attachment["text"]
+    error_details = _parse_error(message_attachment)
+    error_details.update(
+        {
+            "status": _extract_criticality(message),
+            "provider": PROVIDER_PATTERN.search(text).group(1),
+            "booking_type": BOOKING_TYPE_PATTERN.search(text).group(1),
+            "booking_id": BOOKING_ID_PATTERN.search(text).group(1),
+        }
+    )
+    return error_details
+
+
+def is_payment_error(error):
+    return (
+        error["error_class"] in PAYMENT_ERROR_CLASSES
+        or error["error_key"] == "UNKNOWN_CREDIT_CARD_FAILURE"
+        or (
+            error["error_class"] == "car-error"
+            and error["error_key"] == "CAR_BOOKING_CC_DECLINED_ERROR"
+        )
+    )
+
+
+def is_booking_failure(message, since=DEFAULT_SINCE):
+    # Sumo Logic alerts all seem to be "Ambiguous Phone Number", not booking failures
+    return (
+        message.get("subtype") == "bot_message"
+        and float(message["ts"]) > since
+        and message.get("username") != "Sumo Logic"
+    )
+
+
+def load_frame(messages, since=DEFAULT_SINCE):
+    # Parses every message once, straight into columns, so only the extracted
+    # fields of a large archive are ever held in memory
+    columns = {column: [] for column in ["ts", "booking_id", *CATEGORICAL_COLUMNS]}
+    skipped = 0
+    for message in messages:
+        if not is_booking_failure(message, since):
+            continue
+        try:
+            error_details = extract_error_details(message)
+        except (AttributeError, IndexError, KeyError, ValueError):
+            # Truncated past the point of recovery or not an error report
+            skipped += 1
+            continue
+        error_details["ts"] = float(message["ts"])
+        for column, values in columns.items():
+            values.append(error_details[column])
+    frame = pd.DataFrame(columns).astype(
+        {column: "category" for column in CATEGORICAL_COLUMNS}
+    )
+    return frame, skipped
+
+
+def error_counts(frame):
+    # The single group by over the frame, every report below is a cheap
+    # rollup of this (much smaller) series
+    return frame.groupby(CATEGORICAL_COLUMNS, observed=True).size()
+
+
+def payment_error_mask(error_classes, error_keys):
+    # is_payment_error over whole columns
+    return (
+        error_classes.isin(PAYMENT_ERROR_CLASSES)
+        | (error_keys == "UNKNOWN_CREDIT_CARD_FAILURE")
+        | (
+            (error_classes == "car-error")
+            & (error_keys == "CAR_BOOKING_CC_DECLINED_ERROR")
+        )
+    )
+
+
+def _payment_errors(counts):
+    return counts[
+        payment_error_mask(
+            counts.index.get_level_values("error_class"),
+            counts.index.get_level_values("error_key"),
+        )
+    ]
+
+
+def _most_common(counts, levels, top):
+    rollup = counts.groupby(level=levels, observed=True).sum()
+    rollup = rollup[rollup > 0].sort_values(ascending=False, kind="stable").head(top)
+    return [
+        (" - ".join(label) if isinstance(label, tuple) else label, int(count))
+        for label, count in rollup.items()
+    ]
+
+
+def build_report(counts, top=50):
+    # (title, [(label, count)]) in the order of the Booking Error Analysis notebook
+    report = [
+        ("Booking Errors By Priority", _most_common(counts, "status", top)),
+        ("Booking Errors By Provider", _most_common(counts, "provider", top)),
+        ("Booking Errors By Type", _most_common(counts, "booking_type", top)),
+    ]
+    booking_types = counts.index.get_level_values("booking_type")
+    for booking_type in BOOKING_TYPES:
+        type_counts = counts[booking_types == booking_type]
+        report += [
+            (
+                f"{booking_type} Errors By Provider",
+                _most_common(type_counts, "provider", top),
+            ),
+            (
+                f"{booking_type} Errors By Type",
+                _most_common(type_counts, "error_class", top),
+            ),
+            (
+                f"{booking_type} Errors By Subtype",
+                _most_common(type_counts, "error_key", top),
+            ),
+            (
+                f"{booking_type} Errors By Unique Error",
+                _most_common(type_counts, ["error_class", "error_key"], top),
+            ),
+        ]
+    report.append(
+        (
+            "Payment Errors by subtype",
+            _most_common(_payment_errors(counts), "error_key", top),
+        )
+    )
+    return report
+
+
+def format_report(report):
+    lines = []
+    for title, rows in report:
+        lines += ["", title, "-" * len(title)]
+        lines += [f"{count:>8}  {label}" for label, count in rows]
+    return "\n".join(lines)
+
+
+def write_report_csv(report, outfile):
+    writer = csv.writer(outfile)
+    writer.writerow(["report", "value", "count"])
+    for title, rows in report:
+        for label, count in rows:
+            writer.writerow([title, label, count])
+
+
+def parse_date(value):
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
+
+
+def _get_args():
+    parser = argparse.ArgumentParser(
+        description="Booking failure counts by priority, provider, booking type and error"
+    )
+    parser.add_argument(
+        "history",
+        nargs="?",
+        default="booking_failures_channel_history.jsonl",
+        help="Exported #booking-failures channel archive (.jsonl, .jsonl.gz, .jsonl.zst or legacy .json)",
+    )
+    parser.add_argument(
+        "--since",
+        type=parse_date,
+        default=DEFAULT_SINCE,
+        help="Only count failures after this UTC date or epoch. Defaults to 2019-11-22",
+    )
+    parser.add_argument("--top", type=int, default=50, help="Rows per report")
+    parser.add_argument("--csv", help="Also write every report to this csv file")
+    return parser.parse_args()
+
+
+def main():
+    args = _get_args()
+    frame, skipped = load_frame(iter_messages(args.history), args.since)
+    if frame.empty:
+        print("No booking failures found")
+        return 1
+    report = build_report(error_counts(frame), args.top)
+    start, end = [
+        datetime.fromtimestamp(ts, timezone.utc).date()
+        for ts in (frame["ts"].min(), frame["ts"].max())
+    ]
+    print(f"{len(frame)} booking failures from {start} to {end}")
+    if skipped:
+        print(f"Skipped {skipped} messages without a parseable error")
+    print(format_report(report))
+    if args.csv:
+        with open(args.csv, "w", newline="") as outfile:
+            write_report_csv(report, outfile)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
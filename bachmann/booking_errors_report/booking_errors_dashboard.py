@@ -0,0 +1,274 @@
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+from datetime import date, timedelta
+
+import pandas as pd  # type: ignore
+
+from booking_errors import (
+    CATEGORICAL_COLUMNS,
+    DEFAULT_SINCE,
+    build_report,
+    format_report,
+    iter_messages,
+    load_frame,
+    parse_date,
+)
+
+try:
+    # Only needed to render the plots
+    import matplotlib  # type: ignore
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt  # type: ignore
+except ImportError:
+    plt = None
+
+DEFAULT_DB = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "booking_errors.sqlite"
+)
+DEFAULT_DAYS = 60
+# Enough of the start of an archive to tell an append from a fresh export
+FINGERPRINT_BYTES = 64 * 1024
+
+
+def create_schema(conn):
+    c = conn.cursor()
+    # Booking failures counted per UTC day and everything the reports group by
+    c.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS daily_errors (day TEXT, {", ".join(f"{column} TEXT" for column in CATEGORICAL_COLUMNS)}, count INTEGER,
+            PRIMARY KEY (day, {", ".join(CATEGORICAL_COLUMNS)}))
+        """
+    )
+    # How far each archive has been read: its size and fingerprint at the time
+    # and the newest message counted from it
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ingested_archives (path TEXT PRIMARY KEY, size INTEGER, fingerprint TEXT, newest_ts REAL)
+        """
+    )
+    return c
+
+
+def _fingerprint(path, size):
+    with open(path, "rb") as infile:
+        return hashlib.sha1(infile.read(min(size, FINGERPRINT_BYTES))).hexdigest()
+
+
+def _ingest_offset(cursor, path, size):
+    # Exports only ever append to an archive, so when its start is unchanged
+    # reading resumes where the last run stopped. A re-exported archive is read
+    # again from the top, the newest_ts watermark keeps counts from doubling
+    cursor.execute(
+        "SELECT size, fingerprint, newest_ts FROM ingested_archives WHERE path = ?",
+        (path,),
+    )
+    state = cursor.fetchone()
+    if state is None:
+        return 0, None
+    ingested_size, fingerprint, newest_ts = state
+    if ingested_size <= size and _fingerprint(path, ingested_size) == fingerprint:
+        return ingested_size, newest_ts
+    return 0, newest_ts
+
+
+def ingest_archive(cursor, path, since=DEFAULT_SINCE):
+    path = os.path.realpath(path)
+    size = os.path.getsize(path)
+    offset, newest_ts = _ingest_offset(cursor, path, size)
+    frame, skipped = load_frame(
+        iter_messages(path, offset), max(since, newest_ts or since)
+    )
+    if len(frame):
+        days = pd.to_datetime(frame["ts"], unit="s", utc=True).dt.strftime("%Y-%m-%d")
+        counts = (
+            frame.assign(day=days)
+            .groupby(["day", *CATEGORICAL_COLUMNS], observed=True)
+            .size()
+        )
+        cursor.executemany(
+            f"""
+            INSERT INTO daily_errors VALUES (?, {", ".join("?" * len(CATEGORICAL_COLUMNS))}, ?)
+            ON CONFLICT(day, {", ".join(CATEGORICAL_COLUMNS)}) DO UPDATE SET count = count + excluded.count
+            """,
+            ((*group, int(count)) for group, count in counts.items()),
+        )
+        newest_ts = max(newest_ts or since, frame["ts"].max())
+    cursor.execute(
+        """
+        INSERT INTO ingested_archives VALUES (?, ?, ?, ?)
+        ON CONFLICT(path) DO UPDATE SET size = excluded.size, fingerprint = excluded.fingerprint, newest_ts = excluded.newest_ts
+        """,
+        (path, size, _fingerprint(path, size), newest_ts),
+    )
+    return len(frame), skipped
+
+
+def newest_day(cursor):
+    cursor.execute("SELECT max(day) FROM daily_errors")
+    day = cursor.fetchone()[0]
+    return date.fromisoformat(day) if day else None
+
+
+def load_counts(cursor, start, end):
+    # Same shape as booking_errors.error_counts so every report is built the
+    # same way, just from the daily aggregates instead of the messages
+    cursor.execute(
+        f"""
+        SELECT {", ".join(CATEGORICAL_COLUMNS)}, sum(count) FROM daily_errors
+        WHERE day >= ? AND day < ?
+        GROUP BY {", ".join(CATEGORICAL_COLUMNS)}
+        """,
+        (start.isoformat(), end.isoformat()),
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    return pd.Series(
+        [row[-1] for row in rows],
+        index=pd.MultiIndex.from_tuples(
+            [row[:-1] for row in rows], names=CATEGORICAL_COLUMNS
+        ),
+    )
+
+
+def load_daily_totals(cursor, start, end):
+    cursor.execute(
+        """
+        SELECT day, booking_type, sum(count) FROM daily_errors
+        WHERE day >= ? AND day < ?
+        GROUP BY day, booking_type
+        """,
+        (start.isoformat(), end.isoformat()),
+    )
+    return (
+        pd.DataFrame(cursor.fetchall(), columns=["day", "booking_type", "count"])
+        .pivot(index="day", columns="booking_type", values="count")
+        .fillna(0)
+    )
+
+
+def _plot_file(plots_dir, title):
+    return os.path.join(
+        plots_dir, re.sub(r"\W+", "_", title).strip("_").lower() + ".png"
+    )
+
+
+def plot_counter(rows, title, path):
+    # The notebook's pie chart, rows are (label, count)
+    fig, ax = plt.subplots()
+    fig.set_size_inches(10, 10)
+    plt.title(title, y=1.04)
+    ax.pie(
+        [count for _, count in rows],
+        labels=[label for label, _ in rows],
+        autopct="%1.1f%%",
+        shadow=True,
+        startangle=90,
+    )
+    ax.axis("equal")
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def plot_daily_totals(daily_totals, path):
+    fig, ax = plt.subplots()
+    fig.set_size_inches(14, 6)
+    daily_totals.plot(ax=ax, title="Booking Errors Per Day")
+    ax.set_xlabel("")
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def render_plots(report, daily_totals, plots_dir):
+    if plt is None:
+        raise ValueError("Install matplotlib to render the plots")
+    os.makedirs(plots_dir, exist_ok=True)
+    for title, rows in report:
+        if rows:
+            plot_counter(rows, title, _plot_file(plots_dir, title))
+    plot_daily_totals(daily_totals, _plot_file(plots_dir, "Booking Errors Per Day"))
+
+
+def _get_args():
+    parser = argparse.ArgumentParser(
+        description="Add new booking failures to daily aggregates and report from them"
+    )
+    parser.add_argument(
+        "archives",
+        nargs="*",
+        default=["booking_failures_channel_history.jsonl"],
+        help="Exported #booking-failures channel archives, only what was appended since the last run is read",
+    )
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument(
+        "--since",
+        type=parse_date,
+        default=DEFAULT_SINCE,
+        help="Ignore failures before this UTC date or epoch. Defaults to 2019-11-22",
+    )
+    parser.add_argument(
+        "--no-ingest",
+        dest="ingest",
+        action="store_false",
+        help="Only report from what is already aggregated",
+    )
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=DEFAULT_DAYS,
+        help="Report over this many days up to --end",
+    )
+    parser.add_argument(
+        "--end",
+        type=date.fromisoformat,
+        help="Last day reported, defaults to the newest day aggregated",
+    )
+    parser.add_argument("--top", type=int, default=50, help="Rows per report")
+    parser.add_argument(
+        "--plots", help="Render the report as png plots in this directory"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = _get_args()
+    conn = sqlite3.connect(args.db)
+    try:
+        cursor = create_schema(conn)
+        if args.ingest:
+            for path in args.archives:
+                count, skipped = ingest_archive(cursor, path, args.since)
+                conn.commit()
+                print(f"Added {count} new booking failures from {path}")
+                if skipped:
+                    print(f"Skipped {skipped} messages without a parseable error")
+
+        end = args.end or newest_day(cursor)
+        if end is None:
+            print("No booking failures aggregated yet")
+            return 1
+        start = end - timedelta(days=args.days - 1)
+        end += timedelta(days=1)
+        counts = load_counts(cursor, start, end)
+        if counts is None:
+            print(f"No booking failures from {start} to {end}")
+            return 1
+        report = build_report(counts, args.top)
+        print(
+            f"{counts.sum()} booking failures from {start} to {end - timedelta(days=1)}"
+        )
+        print(format_report(report))
+        if args.plots:
+            render_plots(report, load_daily_totals(cursor, start, end), args.plots)
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
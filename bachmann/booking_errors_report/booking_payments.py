@@ -0,0 +1,264 @@
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+
+from booking_errors import (
+    DEFAULT_SINCE,
+    PAYMENT_SUB_TYPE_TO_NAME,
+    iter_messages,
+    load_frame,
+    parse_date,
+    payment_error_mask,
+)
+
+DEFAULT_DB = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "booking_payments.sqlite"
+)
+BATCH_SIZE = 10_000
+SUCCESSFUL_STATUSES = ("booked", "cancelled")
+
+# Exported as a tsv of booking id, payment sub type, booking status, created:
+#
+#   select bookings.id, payment_sub_type, booking_status, bookings.created
+#   from lola_000.bookings
+#   inner join lola_billing.payment_accounts ON bookings.payment_account_id = payment_accounts.id
+#   where bookings.deleted = false;
+#
+# The older two column booking_payments.tsv (id and sub type of the bookings
+# with errors) loads as well, it just doesn't count towards successful bookings
+
+
+def create_schema(conn):
+    c = conn.cursor()
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS booking_payments (booking_id TEXT PRIMARY KEY, payment_sub_type TEXT, booking_status TEXT, created REAL)
+        """
+    )
+    # Covers the successful bookings count without touching the table
+    c.execute(
+        """
+        CREATE INDEX IF NOT EXISTS booking_payments_status_created ON booking_payments (booking_status, created, payment_sub_type)
+        """
+    )
+    return c
+
+
+def _created_epoch(created):
+    if not created:
+        return None
+    moment = datetime.fromisoformat(created)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def _payment_row(row):
+    booking_id, payment_sub_type, *rest = row
+    booking_status = rest[0] if rest else None
+    created = _created_epoch(rest[1]) if len(rest) > 1 else None
+    return booking_id, payment_sub_type, booking_status, created
+
+
+def _upsert_payments(cursor, batch):
+    cursor.executemany(
+        """
+        INSERT INTO booking_payments (booking_id, payment_sub_type, booking_status, created) VALUES (?, ?, ?, ?)
+        ON CONFLICT(booking_id) DO UPDATE SET
+            payment_sub_type = excluded.payment_sub_type,
+            booking_status = coalesce(excluded.booking_status, booking_status),
+            created = coalesce(excluded.created, created)
+        """,
+        batch,
+    )
+
+
+def load_payments(cursor, path, batch_size=BATCH_SIZE):
+    # Reloading an export updates the bookings in it, a row without status
+    # doesn't erase one that has it. A header row, or any other row that
+    # doesn't parse, is skipped. Returns how many rows were loaded and skipped
+    count, skipped, batch = 0, 0, []
+    with open(path, newline="") as infile:
+        for row in csv.reader(infile, delimiter="\t"):
+            if not row:
+                continue
+            try:
+                batch.append(_payment_row(row))
+            except ValueError:
+                skipped += 1
+                continue
+            if len(batch) == batch_size:
+                _upsert_payments(cursor, batch)
+                count += len(batch)
+                batch = []
+    _upsert_payments(cursor, batch)
+    return count + len(batch), skipped
+
+
+def add_payment_errors(cursor, frame):
+    # Payment errors of one report run, joined against booking_payments by query
+    errors = frame[payment_error_mask(frame["error_class"], frame["error_key"])]
+    cursor.execute(
+        """
+        CREATE TEMP TABLE IF NOT EXISTS payment_errors (booking_id TEXT, error_key TEXT)
+        """
+    )
+    cursor.execute("DELETE FROM payment_errors")
+    cursor.executemany(
+        "INSERT INTO payment_errors VALUES (?, ?)",
+        errors[["booking_id", "error_key"]].itertuples(index=False, name=None),
+    )
+    return len(errors)
+
+
+def payment_errors_by_card(cursor):
+    cursor.execute(
+        """
+        SELECT payment_sub_type, count(*), sum(error_key != 'DECLINED')
+        FROM payment_errors
+        INNER JOIN booking_payments USING (booking_id)
+        GROUP BY payment_sub_type
+        """
+    )
+    return {
+        payment_sub_type: (errors, errors_without_decline)
+        for payment_sub_type, errors, errors_without_decline in cursor.fetchall()
+    }
+
+
+def unmatched_payment_errors(cursor):
+    cursor.execute(
+        """
+        SELECT count(*) FROM payment_errors
+        WHERE booking_id NOT IN (SELECT booking_id FROM booking_payments)
+        """
+    )
+    return cursor.fetchone()[0]
+
+
+def successful_bookings_by_card(cursor, since, until):
+    cursor.execute(
+        f"""
+        SELECT payment_sub_type, count(*) FROM booking_payments
+        WHERE booking_status IN ({", ".join("?" * len(SUCCESSFUL_STATUSES))})
+        AND created >= ? AND created < ?
+        GROUP BY payment_sub_type
+        """,
+        (*SUCCESSFUL_STATUSES, since, until),
+    )
+    return dict(cursor.fetchall())
+
+
+def _percentage(count, total):
+    return f"{count / total:.2%}" if total else "n/a"
+
+
+def card_report(successes, errors):
+    # One row per card: share of successful bookings and of payment errors the
+    # way the notebook's table has it, plus the failure rate of the card itself
+    total_successes = sum(successes.values())
+    total_errors = sum(error for error, _ in errors.values())
+    total_without_decline = sum(error for _, error in errors.values())
+    rows = []
+    for payment_sub_type in sorted(successes.keys() | errors.keys()):
+        card_successes = successes.get(payment_sub_type, 0)
+        card_errors, card_without_decline = errors.get(payment_sub_type, (0, 0))
+        rows.append(
+            [
+                PAYMENT_SUB_TYPE_TO_NAME.get(payment_sub_type, payment_sub_type),
+                card_successes,
+                _percentage(card_successes, total_successes),
+                card_errors,
+                _percentage(card_errors, total_errors),
+                _percentage(card_without_decline, total_without_decline),
+                _percentage(card_errors, card_successes + card_errors),
+            ]
+        )
+    return rows
+
+
+REPORT_HEADER = [
+    "Card",
+    "Successful bookings",
+    "% used in successful bookings",
+    "Payment errors",
+    "% involved in errors",
+    "% involved in errors other than 'DECLINED'",
+    "Failure rate",
+]
+
+
+def format_card_report(rows):
+    lines = ["|" + "|".join(REPORT_HEADER) + "|", "|" + "---|" * len(REPORT_HEADER)]
+    lines += ["|" + "|".join(str(value) for value in row) + "|" for row in rows]
+    return "\n".join(lines)
+
+
+def _get_args():
+    parser = argparse.ArgumentParser(
+        description="Payment errors and successful bookings per card, joined in sqlite"
+    )
+    parser.add_argument(
+        "history",
+        nargs="?",
+        default="booking_failures_channel_history.jsonl",
+        help="Exported #booking-failures channel archive",
+    )
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument(
+        "--load",
+        action="append",
+        default=[],
+        metavar="TSV",
+        help="Load (or refresh) booking payments from this export first, can be repeated",
+    )
+    parser.add_argument(
+        "--since",
+        type=parse_date,
+        default=DEFAULT_SINCE,
+        help="UTC date or epoch, applies to errors and successful bookings. Defaults to 2019-11-22",
+    )
+    parser.add_argument(
+        "--until",
+        type=parse_date,
+        help="UTC date or epoch, defaults to the newest error in the archive",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = _get_args()
+    conn = sqlite3.connect(args.db)
+    try:
+        cursor = create_schema(conn)
+        for path in args.load:
+            count, skipped = load_payments(cursor, path)
+            print(f"Loaded {count} booking payments from {path}")
+            if skipped:
+                print(f"Skipped {skipped} rows that didn't parse, e.g. a header")
+            conn.commit()
+
+        frame, _ = load_frame(iter_messages(args.history), args.since)
+        until = args.until
+        if until is None:
+            until = frame["ts"].max() + 1 if len(frame) else datetime.now().timestamp()
+        frame = frame[frame["ts"] < until]
+        print(f"{add_payment_errors(cursor, frame)} payment errors in the archive")
+        unmatched = unmatched_payment_errors(cursor)
+        if unmatched:
+            print(f"{unmatched} of them have no booking payment loaded")
+        rows = card_report(
+            successful_bookings_by_card(cursor, args.since, until),
+            payment_errors_by_card(cursor),
+        )
+        print(format_card_report(rows))
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,63 +1,234 @@
+import argparse
+import hashlib
+import io
+import re
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stderr
+
 import uncurl
 import xerox
 import json
 from urllib.parse import urlparse
 
+POSTMAN_SCHEMA = "https://schema.getpostman.com/json/collection/v2.1.0/collection.json"
+DEFAULT_CHUNK_SIZE = 50
+# Names, punctuation and strings. Whitespace and commas are insignificant in
+# graphql so two queries formatted differently have the same tokens
+GRAPHQL_TOKEN_PATTERN = re.compile(r'"(?:\\.|[^"\\])*"|[^\s,{}():!=\[\]$@."]+|[^\s,]')
+# Where "Copy all as cURL" (or pasting one after the other) starts a new curl
+CURL_START_PATTERN = re.compile(r"^curl\s", re.MULTILINE)
+
 
 def get_query_dict(query):
     result = {}
     for param in query.split("&"):
-        key, value = param.split("=")
+        key, _, value = param.partition("=")
         result[key] = value
     return result
 
 
+def postman_item(name, request_data, raw_url):
+    url = urlparse(raw_url)
+    query_params = get_query_dict(url.query) if url.query else {}
+    return {
+        "name": name,
+        "request": {
+            "method": "POST",
+            "header": [],
+            "body": {
+                "mode": "graphql",
+                "graphql": {
+                    "query": request_data["query"],
+                    "variables": json.dumps(request_data.get("variables")),
+                },
+            },
+            "url": {
+                "raw": raw_url,
+                "protocol": url.scheme,
+                "host": [url.hostname],
+                "port": url.port,
+                "path": url.path.split("/"),
+                "query": [
+                    {"key": key, "value": value} for key, value in query_params.items()
+                ],
+            },
+        },
+        "response": [],
+    }
+
+
+def postman_collection(name, items):
+    return {
+        "info": {"name": name, "schema": POSTMAN_SCHEMA},
+        "item": items,
+        "protocolProfileBehavior": {},
+    }
+
+
+def query_hash(query):
+    normalized = " ".join(GRAPHQL_TOKEN_PATTERN.findall(query))
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+def split_curls(text):
+    # Line continuations are dropped, a copied curl is then one command
+    text = text.replace("\\\r\n", " ").replace("\\\n", " ")
+    starts = [match.start() for match in CURL_START_PATTERN.finditer(text)]
+    for start, end in zip(starts, starts[1:] + [len(text)]):
+        yield text[start:end].strip().rstrip(";&").strip()
+
+
+def har_requests(har):
+    # (url, body) of every POST in a HAR export of the browser's network tab
+    for entry in har["log"]["entries"]:
+        request = entry["request"]
+        body = request.get("postData", {}).get("text")
+        if request["method"] == "POST" and body:
+            yield request["url"], body
+
+
+def read_requests(path):
+    with open(path) as infile:
+        text = infile.read()
+    if path.endswith(".har"):
+        return [("har", request) for request in har_requests(json.loads(text))]
+    return [("curl", curl) for curl in split_curls(text)]
+
+
+def graphql_operations(source):
+    # Runs in a worker process. source is ("curl", command) or ("har", (url,
+    # body)), returns (url, request data) of every graphql operation in it,
+    # more than one when it is a batched request
+    kind, value = source
+    if kind == "curl":
+        try:
+            with redirect_stderr(io.StringIO()):
+                context = uncurl.parse_context(value)
+        except (SystemExit, ValueError):
+            # uncurl reports what it can't parse through argparse, an unclosed
+            # quote is a ValueError from shlex
+            return []
+        url, body = context.url, context.data
+    else:
+        url, body = value
+    try:
+        request_data = json.loads(body)
+    except (TypeError, ValueError):
+        return []
+    operations = request_data if isinstance(request_data, list) else [request_data]
+    return [
+        (url, operation)
+        for operation in operations
+        if isinstance(operation, dict) and isinstance(operation.get("query"), str)
+    ]
+
+
+def parse_requests(sources, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    if workers == 1:
+        return [graphql_operations(source) for source in sources]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(graphql_operations, sources, chunksize=chunk_size))
+
+
+def unique_operations(parsed):
+    # The first request of every operationName and query, in capture order.
+    # Returns them with how often each was captured
+    unique = OrderedDict()
+    for operations in parsed:
+        for url, request_data in operations:
+            key = (
+                request_data.get("operationName") or "anonymous",
+                query_hash(request_data["query"]),
+            )
+            if key not in unique:
+                unique[key] = [url, request_data, 0]
+            unique[key][2] += 1
+    return unique
+
+
+def batch_collection(name, unique):
+    # One folder per operation, a query captured with different selections
+    # under the same operationName gets an item per variant
+    folders = OrderedDict()
+    for (operation_name, digest), (url, request_data, _) in unique.items():
+        folders.setdefault(operation_name, []).append((digest, url, request_data))
+    items = []
+    for operation_name, variants in folders.items():
+        items.append(
+            {
+                "name": operation_name,
+                "item": [
+                    postman_item(
+                        operation_name
+                        if len(variants) == 1
+                        else f"{operation_name} {digest[:8]}",
+                        request_data,
+                        url,
+                    )
+                    for digest, url, request_data in variants
+                ],
+            }
+        )
+    return postman_collection(name, items)
+
+
+def _get_args():
+    parser = argparse.ArgumentParser(
+        description="Turn captured graphql curls into a Postman collection. "
+        "Without inputs the curl on the clipboard is converted"
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        help="HAR exports (.har) or text files of copied curls",
+    )
+    parser.add_argument("--name", default="GraphQL requests", help="Collection name")
+    parser.add_argument(
+        "--output",
+        default="graphql_requests.postman_collection.json",
+        help="Where the batch collection is written",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Parsing processes, defaults to the number of cpus",
+    )
+    return parser.parse_args()
+
+
+def batch_main(args):
+    sources = [source for path in args.inputs for source in read_requests(path)]
+    parsed = parse_requests(sources, args.workers)
+    unique = unique_operations(parsed)
+    with open(args.output, "w") as outfile:
+        json.dump(batch_collection(args.name, unique), outfile, indent=2)
+    captured = sum(count for _, _, count in unique.values())
+    print(f"{len(sources)} requests, {captured} graphql operations")
+    print(f"{len(unique)} unique operations written to {args.output}")
+    skipped = sum(1 for operations in parsed if not operations)
+    if skipped:
+        print(f"Skipped {skipped} requests that are not graphql or didn't parse")
+
+
 def main():
+    args = _get_args()
+    if args.inputs:
+        batch_main(args)
+        return
     curl_input = xerox.paste()
     print("Input: -----")
     print(curl_input)
     print("-----\n\n")
     context = uncurl.parse_context(curl_input)
     request_data = json.loads(context.data)
-    url = urlparse(context.url)
-    query_params = get_query_dict(url.query)
     cookie_string = ";".join(f"{key}={value}" for key, value in context.cookies.items())
-    postman_collection = {
-        "info": {
-            "name": request_data["operationName"],
-            "schema": "https://schema.getpostman.com/json/collection/v2.1.0/collection.json",
-        },
-        "item": [
-            {
-                "name": request_data["operationName"],
-                "request": {
-                    "method": "POST",
-                    "header": [],
-                    "body": {
-                        "mode": "graphql",
-                        "graphql": {
-                            "query": request_data["query"],
-                            "variables": json.dumps(request_data["variables"]),
-                        },
-                    },
-                    "url": {
-                        "raw": context.url,
-                        "protocol": url.scheme,
-                        "host": [url.hostname],
-                        "port": url.port,
-                        "path": url.path.split("/"),
-                        "query": [
-                            {"key": key, "value": value}
-                            for key, value in query_params.items()
-                        ],
-                    },
-                },
-                "response": [],
-            }
-        ],
-        "protocolProfileBehavior": {},
-    }
-    result = json.dumps(postman_collection)
+    collection = postman_collection(
+        request_data["operationName"],
+        [postman_item(request_data["operationName"], request_data, context.url)],
+    )
+    result = json.dumps(collection)
     print("----- Postman Collection ----")
     print(result)
     print("---- Headers -----")
@@ -69,4 +240,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,9 +1,22 @@
-from json import JSONDecodeError
+import argparse
+import re
+import sys
+from json import JSONEncoder
 
 import uncurl
 import xerox
 import json
 
+SEPARATOR = "-----\n\n"
+# Big variables are written out as they are encoded, never as one string
+VARIABLES_ENCODER = JSONEncoder(indent=2, ensure_ascii=False)
+# The body of a copied curl, single quoted by the browser
+DATA_OPTION_PATTERN = re.compile(r"(?<!\S)(?:--data-raw|--data-binary|--data|-d)\s+'")
+# How a single quote is written inside a single quoted shell string
+ESCAPED_QUOTE = "'\\''"
+NON_SPACE_PATTERN = re.compile(r"\S")
+DECODER = json.JSONDecoder()
+
 
 def get_query_dict(query):
     result = {}
@@ -13,20 +26,105 @@ def get_query_dict(query):
     return result
 
 
+def _get_args():
+    parser = argparse.ArgumentParser(
+        description="Pretty print the graphql operations of a captured request"
+    )
+    parser.add_argument(
+        "source",
+        nargs="?",
+        help="File with a curl or a request body, - for stdin. Defaults to the clipboard",
+    )
+    return parser.parse_args()
+
+
+def read_source(source):
+    if source is None:
+        return xerox.paste()
+    if source == "-":
+        return sys.stdin.read()
+    with open(source) as infile:
+        return infile.read()
+
+
+def _single_quoted_data(text):
+    # uncurl tokenizes the whole command with shlex a character at a time,
+    # minutes for a multi-MB body. The quoted body is located instead and
+    # (start, end) of it returned, it is never copied out of the command
+    match = DATA_OPTION_PATTERN.search(text)
+    if match is None:
+        return None
+    end = match.end()
+    while True:
+        end = text.find("'", end)
+        if end == -1:
+            return None
+        if not text.startswith(ESCAPED_QUOTE, end):
+            return match.end(), end
+        end += len(ESCAPED_QUOTE)
+
+
+def request_body(text):
+    # The text holding the request body and (start, end) of the body in it. A
+    # saved request body is used as is, anything else should be a curl
+    first = NON_SPACE_PATTERN.search(text)
+    if first is not None and first.group() in "{[":
+        return text, first.start(), len(text)
+    span = _single_quoted_data(text)
+    if span is None:
+        body = uncurl.parse_context(text).data or ""
+        return body, 0, len(body)
+    start, end = span
+    if text.find(ESCAPED_QUOTE, start, end) != -1:
+        # Only a body with a quote in it has to be copied, to unescape it
+        body = text[start:end].replace(ESCAPED_QUOTE, "'")
+        return body, 0, len(body)
+    return text, start, end
+
+
+def decode_request(text, start, end):
+    # json.loads of text[start:end] without slicing it out
+    first = NON_SPACE_PATTERN.search(text, start, end)
+    if first is None:
+        raise ValueError("Request body is empty")
+    request_data, position = DECODER.raw_decode(text, first.start())
+    if position > end or NON_SPACE_PATTERN.search(text, position, end):
+        raise ValueError("Request body has more than one json value")
+    return request_data
+
+
+def write_operation(operation, out=sys.stdout):
+    if not isinstance(operation, dict):
+        operation = {"variables": operation}
+    out.write(f"{operation.get('operationName')}\n")
+    out.write(SEPARATOR)
+    out.write(f"{operation.get('query')}\n")
+    out.write(SEPARATOR)
+    for chunk in VARIABLES_ENCODER.iterencode(operation.get("variables")):
+        out.write(chunk)
+    out.write("\n")
+
+
 def main():
-    curl_input = xerox.paste()
-    context = uncurl.parse_context(curl_input)
+    args = _get_args()
+    text, start, end = request_body(read_source(args.source))
     try:
-        request_data = json.loads(context.data)
-    except JSONDecodeError:
-        request_data = context.data
-    print(request_data.replace("\\n", "\n"))
-    print(request_data["operationName"])
-    print("-----\n\n")
-    print(request_data["query"])
-    print("-----\n\n")
-    print(json.dumps(request_data["variables"], indent=2))
+        request_data = decode_request(text, start, end)
+    except ValueError:
+        # Not json, show it as readable as it gets
+        print(text[start:end].replace("\\n", "\n"))
+        print("Request body is not json")
+        return 1
+    # Only the decoded request is kept from here on
+    del text
+    # Batched requests are an array of operations
+    operations = request_data if isinstance(request_data, list) else [request_data]
+    for index, operation in enumerate(operations, 1):
+        if len(operations) > 1:
+            print(f"===== Operation {index} of {len(operations)} =====")
+        write_operation(operation)
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,223 @@
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from collections import Counter, OrderedDict
+
+import aiohttp
+
+from curl_to_postman import parse_requests, read_requests, unique_operations
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 30
+PERCENTILES = (50, 90, 99)
+
+
+def load_operations(paths, workers=None, unique=False):
+    # (url, request data) of every graphql operation captured in the HAR
+    # exports or curl files, batched requests are split into their operations
+    sources = [source for path in paths for source in read_requests(path)]
+    parsed = parse_requests(sources, workers)
+    if unique:
+        return [
+            (url, request_data)
+            for url, request_data, _ in unique_operations(parsed).values()
+        ]
+    return [operation for operations in parsed for operation in operations]
+
+
+def response_error(status, payload):
+    if status >= 400:
+        return f"HTTP {status}"
+    try:
+        errors = json.loads(payload).get("errors")
+    except (AttributeError, ValueError):
+        return "Response is not a graphql result"
+    if errors:
+        first = errors[0]
+        return (
+            first.get("message", str(first)) if isinstance(first, dict) else str(first)
+        )
+    return None
+
+
+async def replay(
+    operations,
+    endpoint=None,
+    headers=None,
+    concurrency=DEFAULT_CONCURRENCY,
+    repeat=1,
+    timeout=DEFAULT_TIMEOUT,
+):
+    # Sends every operation repeat times, at most concurrency at once, to the
+    # endpoint or else where it was captured from. Returns (operationName,
+    # seconds, request bytes, response bytes, error or None) per request
+    semaphore = asyncio.Semaphore(concurrency)
+    session_headers = {"content-type": "application/json", **(headers or {})}
+
+    async def send(session, url, request_data):
+        body = json.dumps(request_data).encode()
+        name = request_data.get("operationName") or "anonymous"
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                async with session.post(endpoint or url, data=body) as response:
+                    status, payload = response.status, await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                return (
+                    name,
+                    time.perf_counter() - start,
+                    len(body),
+                    0,
+                    str(e) or type(e).__name__,
+                )
+            elapsed = time.perf_counter() - start
+        return name, elapsed, len(body), len(payload), response_error(status, payload)
+
+    async with aiohttp.ClientSession(
+        headers=session_headers,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        connector=aiohttp.TCPConnector(limit=concurrency),
+    ) as session:
+        return await asyncio.gather(
+            *[
+                send(session, url, request_data)
+                for _ in range(repeat)
+                for url, request_data in operations
+            ]
+        )
+
+
+def percentile(sorted_values, percent):
+    # Nearest rank, an actual measured latency rather than an interpolation
+    return sorted_values[max(math.ceil(percent / 100 * len(sorted_values)) - 1, 0)]
+
+
+def _summary_row(name, results):
+    latencies = sorted(elapsed for _, elapsed, _, _, _ in results)
+    errors = sum(1 for *_, error in results if error)
+    return [
+        name,
+        len(results),
+        f"{errors / len(results):.1%}",
+        *[round(percentile(latencies, percent) * 1000) for percent in PERCENTILES],
+        round(latencies[-1] * 1000),
+        round(sum(size for _, _, size, _, _ in results) / len(results)),
+        round(sum(size for _, _, _, size, _ in results) / len(results)),
+    ]
+
+
+def summarize(results):
+    # One row per operation, slowest p50 first, then all of them together
+    by_operation = OrderedDict()
+    for result in results:
+        by_operation.setdefault(result[0], []).append(result)
+    rows = [_summary_row(name, group) for name, group in by_operation.items()]
+    rows.sort(key=lambda row: -row[3])
+    if len(by_operation) > 1:
+        rows.append(_summary_row("all", results))
+    return rows
+
+
+SUMMARY_HEADER = [
+    "Operation",
+    "Requests",
+    "Errors",
+    *[f"p{percent} ms" for percent in PERCENTILES],
+    "max ms",
+    "Request bytes",
+    "Response bytes",
+]
+
+
+def format_summary(rows):
+    lines = ["|" + "|".join(SUMMARY_HEADER) + "|", "|" + "---|" * len(SUMMARY_HEADER)]
+    lines += ["|" + "|".join(str(value) for value in row) + "|" for row in rows]
+    return "\n".join(lines)
+
+
+def _header(value):
+    name, _, header_value = value.partition(":")
+    return name.strip(), header_value.strip()
+
+
+def _get_args():
+    parser = argparse.ArgumentParser(
+        description="Replay captured graphql requests and report latency per operation"
+    )
+    parser.add_argument(
+        "inputs", nargs="+", help="HAR exports (.har) or text files of copied curls"
+    )
+    parser.add_argument(
+        "--endpoint", help="Send everything here instead of where it was captured from"
+    )
+    parser.add_argument(
+        "-H",
+        "--header",
+        action="append",
+        default=[],
+        type=_header,
+        help="'Name: value' added to every request, e.g. the auth cookie. Can be repeated",
+    )
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="Times every operation is sent"
+    )
+    parser.add_argument(
+        "--unique",
+        action="store_true",
+        help="Replay each operationName and query once instead of every capture",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=DEFAULT_TIMEOUT, help="Seconds per request"
+    )
+    parser.add_argument(
+        "--output", help="Also write the summary as json, to compare runs later"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Processes parsing the captures, defaults to the number of cpus",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = _get_args()
+    operations = load_operations(args.inputs, args.workers, args.unique)
+    if not operations:
+        print("No graphql requests found")
+        return 1
+    print(
+        f"Replaying {len(operations)} operations {args.repeat} times, {args.concurrency} at a time"
+    )
+    start = time.perf_counter()
+    results = asyncio.run(
+        replay(
+            operations,
+            args.endpoint,
+            dict(args.header),
+            args.concurrency,
+            args.repeat,
+            args.timeout,
+        )
+    )
+    elapsed = time.perf_counter() - start
+    rows = summarize(results)
+    print(f"{len(results)} requests in {elapsed:.1f}s, {len(results) / elapsed:.1f}/s")
+    print(format_summary(rows))
+    errors = Counter(error for *_, error in results if error)
+    for error, count in errors.most_common(10):
+        print(f"{count} x {error}")
+    if args.output:
+        with open(args.output, "w") as outfile:
+            json.dump(
+                [dict(zip(SUMMARY_HEADER, row)) for row in rows], outfile, indent=2
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from replay_graphql import replay, summarize
+
+SEARCH_RESPONSE = json.dumps({"data": {"items": [1, 2, 3]}}).encode()
+BROKEN_RESPONSE = json.dumps({"errors": [{"message": "boom"}]}).encode()
+
+SEARCH = {"operationName": "Search", "query": "{ items }", "variables": {"q": "x"}}
+BROKEN = {"operationName": "Broken", "query": "{ broken }"}
+DOWN = {"operationName": "Down", "query": "{ down }"}
+
+
+async def graphql(request):
+    operation_name = (await request.json())["operationName"]
+    if operation_name == "Search":
+        return web.Response(body=SEARCH_RESPONSE, content_type="application/json")
+    if operation_name == "Broken":
+        return web.Response(body=BROKEN_RESPONSE, content_type="application/json")
+    return web.Response(status=500, body=b"down")
+
+
+async def replay_against_server(operations, repeat):
+    app = web.Application()
+    app.router.add_post("/graphql", graphql)
+    async with TestServer(app) as server:
+        # Captured somewhere else, everything goes to the endpoint
+        return await replay(operations, str(server.make_url("/graphql")), repeat=repeat)
+
+
+def test_replay_summary():
+    operations = [
+        ("http://captured.invalid/graphql", operation)
+        for operation in (SEARCH, BROKEN, DOWN)
+    ]
+    results = asyncio.run(replay_against_server(operations, repeat=2))
+
+    assert len(results) == 6
+    assert sorted(error for *_, error in results if error) == [
+        "HTTP 500",
+        "HTTP 500",
+        "boom",
+        "boom",
+    ]
+    rows = {row[0]: row for row in summarize(results)}
+    assert rows.keys() == {"Search", "Broken", "Down", "all"}
+    for name, operation, response, errors in (
+        ("Search", SEARCH, SEARCH_RESPONSE, "0.0%"),
+        ("Broken", BROKEN, BROKEN_RESPONSE, "100.0%"),
+        ("Down", DOWN, b"down", "100.0%"),
+    ):
+        row = rows[name]
+        assert row[1:3] == [2, errors]
+        assert row[-2:] == [len(json.dumps(operation).encode()), len(response)]
+    assert rows["all"][1:3] == [6, "66.7%"]
+
+
+def test_replay_connection_error():
+    async def unreachable():
+        async with TestServer(web.Application()) as server:
+            url = str(server.make_url("/graphql"))
+        # The server is closed by now
+        return await replay([(url, SEARCH)])
+
+    ((name, _, request_bytes, response_bytes, error),) = asyncio.run(unreachable())
+    assert (name, request_bytes, response_bytes) == (
+        "Search",
+        len(json.dumps(SEARCH).encode()),
+        0,
+    )
+    assert error
@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from logs_to_database import (
+    ALERT_TABLES,
+    FETCH_ALERTS_QUERY,
+    create_schema,
+    fetch_alerts,
+    insert_alerts,
+)
+
+ALERT_TYPES = ["DEPARTURE_DELAY", "ARRIVAL_DELAY", "GATE_CHANGE", "CANCELLED"]
+# Roughly the size of a real stored alert so the page cache effect is realistic
+NOTIFICATION_PADDING = "x" * 2000
+
+
+def _get_args():
+    parser = argparse.ArgumentParser(
+        description="Build a synthetic logs db and time booking lookups against it"
+    )
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Rows per table")
+    parser.add_argument("--bookings", type=int, default=50_000)
+    parser.add_argument("--lookups", type=int, default=1_000)
+    parser.add_argument(
+        "--db", help="Where to build the db. Defaults to a temporary file"
+    )
+    return parser.parse_args()
+
+
+def _synthetic_rows(table, rows, bookings):
+    for i in range(rows):
+        yield (
+            f"B{random.randrange(bookings)}",
+            f"{table}-{i}",
+            random.choice(ALERT_TYPES),
+            "2020-03-13T15:18:56Z",
+            1584112736.0,
+            1584112736.0 + i,
+            json.dumps({"id": i, "padding": NOTIFICATION_PADDING}),
+        )
+
+
+def build_database(db_file, rows, bookings):
+    conn = sqlite3.connect(db_file)
+    cursor = create_schema(conn)
+    for table in ALERT_TABLES:
+        insert_alerts(cursor, table, _synthetic_rows(table, rows, bookings), 10_000)
+    conn.commit()
+    return conn
+
+
+def explain(cursor, table):
+    cursor.execute(
+        "EXPLAIN QUERY PLAN " + FETCH_ALERTS_QUERY.format(table=table),
+        ("B0",),
+    )
+    return [row[-1] for row in cursor.fetchall()]
+
+
+def time_lookups(cursor, bookings, lookups):
+    refids = [f"B{random.randrange(bookings)}" for _ in range(lookups)]
+    start = time.perf_counter()
+    for refid in refids:
+        for table in ALERT_TABLES:
+            fetch_alerts(cursor, table, refid)
+    return time.perf_counter() - start
+
+
+def main():
+    args = _get_args()
+    db_file = args.db or os.path.join(tempfile.mkdtemp(), "logsdb_benchmark.sqlite")
+    print(f"Building {args.rows} rows per table in {db_file}")
+    start = time.perf_counter()
+    conn = build_database(db_file, args.rows, args.bookings)
+    print(f"Built in {time.perf_counter() - start:.1f}s")
+    cursor = conn.cursor()
+
+    for table in ALERT_TABLES:
+        plan = explain(cursor, table)
+        print(f"{table}: {' | '.join(plan)}")
+        if not any(f"USING INDEX {table}_refid_our_time" in step for step in plan):
+            print(f"Lookup on {table} is not using the (refid, ourTime) index")
+            return 1
+
+    elapsed = time_lookups(cursor, args.bookings, args.lookups)
+    print(
+        f"{args.lookups} bookings looked up in {elapsed:.3f}s "
+        f"({elapsed / args.lookups * 1000:.3f}ms per booking)"
+    )
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
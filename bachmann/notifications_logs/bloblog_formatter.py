@@ -0,0 +1,287 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from xml.dom import minidom
+from xml.parsers.expat import ExpatError
+
+from bloblog_index import add_bloblog, create_schema
+from logs_to_database import chunked
+
+# Same header getbloblogs puts on every extracted message so that grepping
+# for a search_id finds them. json doesn't support comments but it reads fine
+METADATA_HEADER = """{start}
+# LOLA METADATA
+#    search_id : {search_id}
+#    request_id: {request_id}
+#    user_id   : {user_id}
+#    timestamp : {timestamp}
+{end}
+
+"""
+COMMENT_BLOCKS = {"xml": ("<!--", "-->"), "json": ("/*", "*/")}
+# Bloblogs read or downloaded before handing them to the worker processes
+DEFAULT_CHUNK_SIZE = 200
+
+
+def _raw(value):
+    # How `jq -r` prints a value
+    if value is None:
+        return "null"
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def blob_metadata(blob):
+    # The Lola correlation ids, looked up once per bloblog
+    if not isinstance(blob, dict):
+        blob = {}
+    request_id = blob.get("request_id")
+    if request_id is None and isinstance(blob.get("request"), dict):
+        # Some bloblogs call it id, nested in a request element
+        request_id = blob["request"].get("id")
+    return {
+        "search_id": blob.get("search_id"),
+        "request_id": request_id,
+        "user_id": blob.get("user_id"),
+        "timestamp": blob.get("timestamp"),
+    }
+
+
+def metadata_header(metadata, comment_type):
+    start, end = COMMENT_BLOCKS[comment_type]
+    return METADATA_HEADER.format(
+        start=start,
+        end=end,
+        **{name: _raw(value) for name, value in metadata.items()},
+    )
+
+
+def _strip_whitespace_nodes(node):
+    for child in list(node.childNodes):
+        if child.nodeType == child.TEXT_NODE and not child.data.strip():
+            node.removeChild(child)
+        else:
+            _strip_whitespace_nodes(child)
+
+
+def pretty_xml(text):
+    # xmllint --format. Left as is when it isn't well formed
+    try:
+        document = minidom.parseString(text.strip())
+    except ExpatError:
+        return text
+    _strip_whitespace_nodes(document)
+    return document.toprettyxml(indent="  ")
+
+
+def pretty_json(value):
+    # jq .
+    return json.dumps(value, indent=2, ensure_ascii=False) + "\n"
+
+
+def _nested(blob, *keys):
+    for key in keys:
+        if not isinstance(blob, dict):
+            return None
+        blob = blob.get(key)
+    return blob
+
+
+def _format_amadeus_legacy(base, blob, metadata):
+    if blob.get("xml") is None:
+        return []
+    header = metadata_header(metadata, "xml")
+    return [(f"{base}.xml", "message", header + pretty_xml(blob["xml"]))]
+
+
+def _format_amd_flight(base, blob, metadata):
+    # Both the request and the response are in a single bloblog
+    messages = []
+    for msg_type, node in (("request", "data"), ("response", "body")):
+        body = _nested(blob, "data", msg_type, node)
+        if body is not None:
+            messages.append(
+                (
+                    f"{base}_{msg_type}.xml",
+                    msg_type,
+                    metadata_header(metadata, "xml") + pretty_xml(_raw(body)),
+                )
+            )
+    return messages
+
+
+def _format_sabre(base, blob, metadata):
+    # The file name does not say whether this is a request or a response and
+    # the message body is in a different place for each
+    messages = []
+    for msg_type, node in (("request", "body"), ("response", "response")):
+        body = blob.get(node)
+        if body is None or body is False:
+            continue
+        if isinstance(body, str):
+            try:
+                body = json.loads(body)
+            except ValueError:
+                pass
+        messages.append(
+            (
+                f"{base}_{msg_type}.json",
+                msg_type,
+                metadata_header(metadata, "json") + pretty_json(body),
+            )
+        )
+    # Without a json body look for xml, some of Sabre is still using Zeep
+    event = blob.get("event")
+    if not messages and isinstance(event, str) and "<?xml" in event:
+        xml = event.split("\n", 1)[1] if "\n" in event else ""
+        header = metadata_header(metadata, "xml")
+        messages.append((f"{base}.xml", "message", header + pretty_xml(xml)))
+    return messages
+
+
+# (file name marker, provider, formatter), the first matching marker wins
+PROVIDER_FORMATTERS = [
+    ("travel-service_AMD", "amadeus_legacy", _format_amadeus_legacy),
+    ("_amd_flight_", "amadeus", _format_amd_flight),
+    ("travel-service_Sabre_", "sabre", _format_sabre),
+]
+
+
+def format_blob(name, data):
+    # Returns the pretty printed bloblog, (file name, message type, contents)
+    # for every provider message embedded in it and the bloblog's metadata
+    blob = json.loads(data)
+    base = name[: -len(".json")] if name.endswith(".json") else name
+    metadata = {**blob_metadata(blob), "provider": None}
+    messages = []
+    for marker, provider, formatter in PROVIDER_FORMATTERS:
+        if marker in name:
+            metadata["provider"] = provider
+            if isinstance(blob, dict):
+                messages = formatter(base, blob, metadata)
+            break
+    return pretty_json(blob), messages, metadata
+
+
+def write_formatted(name, data, output_dir="."):
+    # Like getbloblogs: the bloblog is written pretty printed and, when a
+    # provider message was extracted from it, kept for context as <name>.orig.
+    # Returns the metadata and (file name, message type) of every file written
+    try:
+        pretty, messages, metadata = format_blob(name, data)
+    except ValueError:
+        # Empty or not json, written as it was stored so the rest still get formatted
+        with open(os.path.join(output_dir, name), "wb") as outfile:
+            outfile.write(data if isinstance(data, bytes) else data.encode())
+        return {**blob_metadata(None), "provider": None}, [(name, "bloblog")]
+    written = [(name + ".orig" if messages else name, "bloblog", pretty)]
+    written += messages
+    for path, _, contents in written:
+        with open(os.path.join(output_dir, path), "w") as outfile:
+            outfile.write(contents)
+    if messages and os.path.exists(os.path.join(output_dir, name)):
+        os.remove(os.path.join(output_dir, name))
+    return metadata, [(path, message_type) for path, message_type, _ in written]
+
+
+def format_file(path, output_dir=None):
+    # Formatted in place by default, as getbloblogs does with a local file.
+    # Returns what write_formatted does
+    with open(path, "rb") as infile:
+        data = infile.read()
+    if data.startswith(COMMENT_BLOCKS["json"][0].encode()):
+        # A message extracted by an earlier run, it has the metadata header
+        return None, []
+    output_dir = output_dir or os.path.dirname(path) or "."
+    return write_formatted(os.path.basename(path), data, output_dir)
+
+
+def format_all(function, items, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Applies function (format_file or write_formatted) to every tuple of
+    # arguments in items across a process pool. items can be a generator, it is
+    # consumed a chunk at a time. Each bloblog is parsed once in a worker and
+    # only the names of the files written come back
+    if workers == 1:
+        yield from (function(*args) for args in items)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in chunked(items, chunk_size):
+            yield from executor.map(function, *zip(*chunk))
+
+
+def iter_bloblog_paths(targets):
+    for target in targets:
+        if not os.path.isdir(target):
+            yield target
+            continue
+        # e.g. after aws s3 sync, .orig files and extracted xml are skipped
+        for dirpath, _, filenames in os.walk(target):
+            for filename in sorted(filenames):
+                if filename.endswith(".json"):
+                    yield os.path.join(dirpath, filename)
+
+
+def _get_args():
+    parser = argparse.ArgumentParser(
+        description="Pretty print downloaded bloblogs and extract the Amadeus or "
+        "Sabre message embedded in them"
+    )
+    parser.add_argument(
+        "targets", nargs="+", help="bloblog files or directories of them"
+    )
+    parser.add_argument(
+        "--output-dir", help="Defaults to formatting each bloblog in place"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Formatting processes, defaults to the number of cpus",
+    )
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument(
+        "--index",
+        help="Add what is formatted to this sqlite index, see bloblog_index.py",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = _get_args()
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    paths = list(iter_bloblog_paths(args.targets))
+    items = [(path, args.output_dir) for path in paths]
+    count = 0
+    conn = sqlite3.connect(args.index) if args.index else None
+    try:
+        cursor = create_schema(conn) if conn else None
+        # Stored when it was downloaded, before formatting rewrites it
+        modified = [os.path.getmtime(path) for path in paths]
+        for path, mtime, (metadata, written) in zip(
+            paths,
+            modified,
+            format_all(format_file, items, args.workers, args.chunk_size),
+        ):
+            if not written:
+                continue
+            if cursor:
+                output_dir = args.output_dir or os.path.dirname(path) or "."
+                add_bloblog(cursor, path, mtime, metadata, written, output_dir)
+            count += 1
+            print(f"  {path}")
+            for name, _ in written:
+                print(f"+ {name}")
+    finally:
+        if conn:
+            conn.commit()
+            conn.close()
+    print(f"{count} bloblogs formatted")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
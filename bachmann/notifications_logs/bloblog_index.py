@@ -0,0 +1,163 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+DEFAULT_INDEX = "bloblogs.sqlite"
+# What a lookup can filter on, all of them are indexed
+LOOKUP_COLUMNS = ("user_id", "search_id", "request_id", "provider", "message_type")
+
+
+def create_schema(conn):
+    c = conn.cursor()
+    # One row per file written for a bloblog: the pretty printed bloblog and
+    # every message extracted from it. modified is when the bloblog was stored,
+    # timestamp is whatever the bloblog says
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS bloblog_files (path TEXT PRIMARY KEY, bloblog TEXT, user_id TEXT, search_id TEXT, request_id TEXT, provider TEXT, message_type TEXT, timestamp TEXT, modified REAL)
+        """
+    )
+    c.execute(
+        """
+        CREATE INDEX IF NOT EXISTS bloblog_files_search_id ON bloblog_files (search_id, modified)
+        """
+    )
+    c.execute(
+        """
+        CREATE INDEX IF NOT EXISTS bloblog_files_request_id ON bloblog_files (request_id, modified)
+        """
+    )
+    c.execute(
+        """
+        CREATE INDEX IF NOT EXISTS bloblog_files_user_id ON bloblog_files (user_id, modified)
+        """
+    )
+    c.execute(
+        """
+        CREATE INDEX IF NOT EXISTS bloblog_files_provider ON bloblog_files (provider, message_type, modified)
+        """
+    )
+    return c
+
+
+def _column(value):
+    # Ids are usually strings or numbers, anything else is kept as json
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return json.dumps(value)
+
+
+def index_rows(bloblog, modified, metadata, written, output_dir):
+    # metadata and written as returned by bloblog_formatter.write_formatted
+    for name, message_type in written:
+        yield (
+            os.path.realpath(os.path.join(output_dir, name)),
+            bloblog,
+            _column(metadata["user_id"]),
+            _column(metadata["search_id"]),
+            _column(metadata["request_id"]),
+            metadata["provider"],
+            message_type,
+            _column(metadata["timestamp"]),
+            modified,
+        )
+
+
+def add_bloblog(cursor, bloblog, modified, metadata, written, output_dir):
+    # Fetching a bloblog again replaces what was indexed for its files
+    cursor.executemany(
+        """
+        INSERT INTO bloblog_files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(path) DO UPDATE SET
+            bloblog = excluded.bloblog,
+            user_id = excluded.user_id,
+            search_id = excluded.search_id,
+            request_id = excluded.request_id,
+            provider = excluded.provider,
+            message_type = excluded.message_type,
+            timestamp = excluded.timestamp,
+            modified = excluded.modified
+        """,
+        index_rows(bloblog, modified, metadata, written, output_dir),
+    )
+
+
+def find_bloblogs(cursor, start=None, end=None, **lookups):
+    # lookups are LOOKUP_COLUMNS to match exactly, start and end bound modified
+    conditions, parameters = [], []
+    for column, value in lookups.items():
+        if column not in LOOKUP_COLUMNS:
+            raise ValueError(f"Can't look bloblogs up by {column}")
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            parameters.append(str(value))
+    if start is not None:
+        conditions.append("modified >= ?")
+        parameters.append(start)
+    if end is not None:
+        conditions.append("modified < ?")
+        parameters.append(end)
+    cursor.execute(
+        f"""
+        SELECT path, provider, message_type, search_id, request_id, timestamp, modified
+        FROM bloblog_files
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        ORDER BY modified, path
+        """,
+        parameters,
+    )
+    return cursor.fetchall()
+
+
+def _local_epoch(value):
+    return datetime.fromisoformat(value).astimezone().timestamp()
+
+
+def _get_args():
+    parser = argparse.ArgumentParser(
+        description="Find downloaded bloblogs in the index get_bloblogs builds"
+    )
+    parser.add_argument(
+        "--db",
+        default=DEFAULT_INDEX,
+        help="Index to search, get_bloblogs keeps it in its output dir",
+    )
+    for column in LOOKUP_COLUMNS:
+        parser.add_argument(f"--{column.replace('_', '-')}", dest=column)
+    parser.add_argument(
+        "--start", type=_local_epoch, help="Stored from this local time on"
+    )
+    parser.add_argument(
+        "--end", type=_local_epoch, help="Stored before this local time"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = _get_args()
+    if not os.path.exists(args.db):
+        print(f"No bloblog index at {args.db}")
+        return 1
+    conn = sqlite3.connect(args.db)
+    try:
+        rows = find_bloblogs(
+            conn.cursor(),
+            args.start,
+            args.end,
+            **{column: getattr(args, column) for column in LOOKUP_COLUMNS},
+        )
+    finally:
+        conn.close()
+    for path, provider, message_type, search_id, request_id, timestamp, _ in rows:
+        print(
+            f"{timestamp}  {provider or '-'}  {message_type}  search_id={search_id}  request_id={request_id}  {path}"
+        )
+    print(f"{len(rows)} files")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,58 +1,241 @@
+import csv
 import os
 import sqlite3
 import sys
+from collections import Counter
 from datetime import datetime
+from itertools import groupby, zip_longest
+from operator import itemgetter
 
 import terminaltables
 from sqlite3 import Error
 import argparse
 
+from logs_to_database import fetch_alerts
 
-def _get_args():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("booking_id", help="Which booking to compare?")
-    return parser.parse_args()
 
+PROVIDERS = ("lumo", "flightstats")
+# Each provider's alert type (upper cased) -> the type alerts are paired on.
+# The providers name the same event differently and nothing guarantees the
+# names line up, so only what is listed here is compared. Anything else is
+# reported as unmapped, not as an alert only one provider sent, and should be
+# added here once it is known what it corresponds to
+ALERT_TYPE_MAPPINGS = {
+    "lumo": {
+        "DEPARTURE_DELAY": "DEPARTURE_DELAY",
+        "ARRIVAL_DELAY": "ARRIVAL_DELAY",
+        "GATE_CHANGE": "DEPARTURE_GATE",
+        "CANCELLED": "CANCELLED",
+        "DIVERTED": "DIVERTED",
+    },
+    "flightstats": {
+        "DEPARTURE_DELAY": "DEPARTURE_DELAY",
+        "ARRIVAL_DELAY": "ARRIVAL_DELAY",
+        "DEPARTURE_GATE": "DEPARTURE_GATE",
+        "CANCELLED": "CANCELLED",
+        "DIVERTED": "DIVERTED",
+    },
+}
 
-def _format_time(time_in):
-    try:
-        time_in_converted = datetime.utcfromtimestamp(float(time_in))
 
-    except ValueError:
-        # 2020-03-13T15:18:56.19Z
-        try:
-            time_in_converted = datetime.strptime(time_in, "%Y-%m-%dT%H:%M:%S.%fZ")
-        except ValueError:
-            time_in_converted = datetime.strptime(time_in, "%Y-%m-%dT%H:%M:%SZ")
+def _get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("booking_id", nargs="?", help="Which booking to compare?")
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Compare every booking in the db instead of a single one",
+    )
+    parser.add_argument(
+        "--bookings",
+        type=argparse.FileType("r"),
+        help="File with one booking id per line to compare, implies --batch",
+    )
+    parser.add_argument(
+        "--csv",
+        default="comparison.csv",
+        help="Where batch mode writes the per alert comparison",
+    )
+    args = parser.parse_args()
+    if not (args.booking_id or args.batch or args.bookings):
+        parser.error("a booking_id, --batch or --bookings is required")
+    return args
 
-    return time_in_converted.strftime("%b %d - %H:%M:%S")
+
+def _format_time(epoch):
+    return datetime.utcfromtimestamp(epoch).strftime("%b %d - %H:%M:%S")
 
 
 def get_table(table_rows, title):
     table_data = [["Alert Type", "Reported Time"]]
-    for row in table_rows:
-        alert_type, reported_time = row[2:-2]
+    for alert_type, reported_time in table_rows:
         reported_time = _format_time(reported_time)
         table_data.append([alert_type, reported_time])
     return terminaltables.other_tables.SingleTable(table_data, title=title)
 
 
+def _yield_alerts_by_booking(cursor, booking_ids=None):
+    where = ""
+    if booking_ids is not None:
+        cursor.execute("CREATE TEMP TABLE bookings (refid TEXT PRIMARY KEY)")
+        cursor.executemany(
+            "INSERT OR IGNORE INTO bookings VALUES(?)", ((b,) for b in booking_ids)
+        )
+        where = "where refid in (SELECT refid from temp.bookings)"
+    # One sorted scan over both providers, walked in booking order
+    cursor.execute(
+        f"""
+        SELECT refid, 'lumo', type, ourTime from lumo {where}
+        UNION ALL
+        SELECT refid, 'flightstats', type, ourTime from flightstats {where}
+        ORDER BY refid, ourTime
+        """
+    )
+    for refid, rows in groupby(cursor, key=itemgetter(0)):
+        yield refid, rows
+
+
+def match_alerts(rows):
+    # Alerts of the same type are paired up in the order we received them, the
+    # leftovers are alerts only one of the providers sent. Returns the pairs
+    # and (provider, alert type) of every alert whose type isn't mapped
+    times_by_type = {provider: {} for provider in PROVIDERS}
+    unmapped = []
+    for _, provider, alert_type, our_time in rows:
+        canonical_type = ALERT_TYPE_MAPPINGS[provider].get(alert_type.upper())
+        if canonical_type is None:
+            unmapped.append((provider, alert_type))
+            continue
+        times_by_type[provider].setdefault(canonical_type, []).append(our_time)
+    matches = []
+    for alert_type in sorted(
+        times_by_type["lumo"].keys() | times_by_type["flightstats"].keys()
+    ):
+        matches += [
+            (alert_type, lumo_time, flightstats_time)
+            for lumo_time, flightstats_time in zip_longest(
+                times_by_type["lumo"].get(alert_type, []),
+                times_by_type["flightstats"].get(alert_type, []),
+            )
+        ]
+    return matches, unmapped
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = round(percent / 100 * (len(sorted_values) - 1))
+    return sorted_values[index]
+
+
+def _format_seconds(seconds):
+    return "" if seconds is None else f"{seconds:.1f}"
+
+
+def get_summary_table(stats_by_type):
+    table_data = [
+        [
+            "Alert Type",
+            "Both",
+            "Lumo only",
+            "Flightstats only",
+            "p50 delta (s)",
+            "p90 delta (s)",
+            "p99 delta (s)",
+        ]
+    ]
+    for alert_type, stats in sorted(stats_by_type.items()):
+        deltas = sorted(stats["deltas"])
+        table_data.append(
+            [
+                alert_type,
+                len(deltas),
+                stats["lumo_only"],
+                stats["flightstats_only"],
+                _format_seconds(_percentile(deltas, 50)),
+                _format_seconds(_percentile(deltas, 90)),
+                _format_seconds(_percentile(deltas, 99)),
+            ]
+        )
+    return terminaltables.other_tables.SingleTable(
+        table_data, title="Lumo - Flightstats (positive means Lumo was later)"
+    )
+
+
+def get_unmapped_table(unmapped_counts):
+    table_data = [["Provider", "Alert Type", "Alerts"]]
+    for (provider, alert_type), count in sorted(unmapped_counts.items()):
+        table_data.append([provider, alert_type, count])
+    return terminaltables.other_tables.SingleTable(
+        table_data, title="Unmapped alert types, not compared"
+    )
+
+
+def compare_bookings(cursor, outfile, booking_ids=None):
+    writer = csv.writer(outfile)
+    writer.writerow(
+        ["booking_id", "alert_type", "lumo_time", "flightstats_time", "delta_seconds"]
+    )
+    stats_by_type = {}
+    unmapped_counts = Counter()
+    bookings = 0
+    for refid, rows in _yield_alerts_by_booking(cursor, booking_ids):
+        bookings += 1
+        matches, unmapped = match_alerts(rows)
+        unmapped_counts.update(unmapped)
+        for alert_type, lumo_time, flightstats_time in matches:
+            stats = stats_by_type.setdefault(
+                alert_type, {"deltas": [], "lumo_only": 0, "flightstats_only": 0}
+            )
+            delta = None
+            if lumo_time is None:
+                stats["flightstats_only"] += 1
+            elif flightstats_time is None:
+                stats["lumo_only"] += 1
+            else:
+                delta = lumo_time - flightstats_time
+                stats["deltas"].append(delta)
+            writer.writerow(
+                [refid, alert_type, lumo_time, flightstats_time, _format_seconds(delta)]
+            )
+    return bookings, stats_by_type, unmapped_counts
+
+
+def batch_main(args):
+    booking_ids = None
+    if args.bookings:
+        booking_ids = [line.strip() for line in args.bookings if line.strip()]
+    try:
+        conn = sqlite3.connect(
+            os.path.join(os.path.dirname(os.path.realpath(__file__)), "logsdb.sqlite")
+        )
+        with open(args.csv, "w", newline="") as outfile:
+            bookings, stats_by_type, unmapped_counts = compare_bookings(
+                conn.cursor(), outfile, booking_ids
+            )
+    except Error as e:
+        print(f"Sqlite Error: {e}")
+        return 1
+    finally:
+        conn.close()
+    print(f"Compared {bookings} bookings, details written to {args.csv}")
+    print(get_summary_table(stats_by_type).table)
+    if unmapped_counts:
+        print(get_unmapped_table(unmapped_counts).table)
+    return 0
+
+
 def main():
     args = _get_args()
+    if args.batch or args.bookings:
+        return batch_main(args)
     try:
         conn = sqlite3.connect(
             os.path.join(os.path.dirname(os.path.realpath(__file__)), "logsdb.sqlite")
         )
         cursor = conn.cursor()
-        cursor.execute(
-            "SELECT * from lumo where refid = ? order by ourTime", (args.booking_id,),
-        )
-        lumo_rows = cursor.fetchall()
-        cursor.execute(
-            "SELECT * from flightstats where refid = ? order by ourTime",
-            (args.booking_id,),
-        )
-        flightstats_rows = cursor.fetchall()
+        lumo_rows = fetch_alerts(cursor, "lumo", args.booking_id)
+        flightstats_rows = fetch_alerts(cursor, "flightstats", args.booking_id)
     except Error as e:
         print(f"Sqlite Error: {e}")
         return 1
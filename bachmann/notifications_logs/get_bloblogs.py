@@ -0,0 +1,189 @@
+import argparse
+import os
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import repeat
+from urllib.parse import urlparse
+
+from botocore.exceptions import BotoCoreError, ClientError  # type: ignore
+
+from bloblog_formatter import (
+    DEFAULT_CHUNK_SIZE,
+    format_all,
+    format_file,
+    write_formatted,
+)
+from bloblog_index import DEFAULT_INDEX, add_bloblog, create_schema
+from logs_to_database import chunked
+from s3_logs_to_database import DEFAULT_WORKERS, get_client, list_objects
+
+BLOBLOGS_LOCATIONS = {
+    "prod": ("bloblogs.ops.lola.com", "blobs/production"),
+    "staging": ("bloblogs.ops.lola.co", "blobs/staging"),
+    "dev": ("bloblogs.ops.lola.co", "blobs/dev"),
+    "smoke": ("bloblogs.ops.lola.co", "blobs/smoke"),
+}
+AWS_MFA_WARNING = "***** ERROR: s3 request failed! Have you run aws-mfa recently?"
+
+
+def _local_date(value):
+    # Same as getbloblogs, dates are in the local timezone
+    return datetime.fromisoformat(value).astimezone()
+
+
+def _get_args():
+    parser = argparse.ArgumentParser(
+        description="Download and pretty print bloblogs: every bloblog of a user "
+        "in a time range, or a single one by url, s3 path or local file",
+        epilog="If a bloblog has an embedded Amadeus or Sabre message it is "
+        "extracted, pretty printed and saved next to it with the Lola metadata "
+        "as a header comment. The original is kept as <name>.orig",
+    )
+    parser.add_argument("target", help="user id, bloblog url, s3 path or local file")
+    parser.add_argument(
+        "--start", type=_local_date, help="e.g. '2020-09-21 11:34:00', local time"
+    )
+    parser.add_argument("--end", type=_local_date, help="Defaults to now")
+    parser.add_argument(
+        "--hours-back", type=float, help="Instead of --start, from this many hours ago"
+    )
+    parser.add_argument(
+        "--env", choices=list(BLOBLOGS_LOCATIONS.keys()), default="prod"
+    )
+    parser.add_argument(
+        "--endpoint-url", help="Alternative s3 endpoint, e.g. a local minio"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Concurrent downloads, also the size of the connection pool",
+    )
+    parser.add_argument(
+        "--format-workers",
+        type=int,
+        help="Processes formatting the downloaded bloblogs, defaults to the number of cpus",
+    )
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument(
+        "--index",
+        help=f"sqlite index of the bloblogs fetched, search it with bloblog_index.py. Defaults to {DEFAULT_INDEX} in the output dir",
+    )
+    return parser.parse_args()
+
+
+def _s3_location(target):
+    # Direct https links to blobs found in Sumo or Womcon work as well
+    parsed = urlparse(target)
+    if parsed.scheme not in ("s3", "https"):
+        return None
+    return parsed.netloc, parsed.path.lstrip("/")
+
+
+def _fetch(client, bucket, key):
+    response = client.get_object(Bucket=bucket, Key=key)
+    return response["Body"].read(), response["LastModified"].timestamp()
+
+
+def _format_downloaded(key, fetched, output_dir):
+    # Runs in a worker process
+    body, modified = fetched
+    metadata, written = write_formatted(os.path.basename(key), body, output_dir)
+    return key, modified, metadata, written
+
+
+def get_user_bloblogs(
+    client,
+    bucket,
+    prefix,
+    user_id,
+    start=None,
+    end=None,
+    output_dir=".",
+    workers=DEFAULT_WORKERS,
+    format_workers=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+):
+    # Only the user's prefix is listed. Keys carry no date and S3 can't filter
+    # on LastModified, so like getbloblogs every key of the user is listed and
+    # the ones outside [start, end) are dropped as each page arrives, nothing
+    # is fetched for them. A chunk of matching objects at a time is downloaded by
+    # threads over one pooled client, then formatted across a process pool.
+    # Yields (key, LastModified epoch, metadata, (file name, message type)
+    # of the files written)
+    objects = list_objects(client, bucket, f"{prefix}/{user_id}/", start, end)
+
+    def downloaded():
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for chunk in chunked(objects, chunk_size):
+                keys = sorted(obj["Key"] for obj in chunk)
+                fetched = executor.map(lambda key: _fetch(client, bucket, key), keys)
+                yield from zip(keys, fetched, repeat(output_dir))
+
+    return format_all(_format_downloaded, downloaded(), format_workers, chunk_size)
+
+
+def _print_written(written):
+    for path, _ in written:
+        print(f"+ {path}")
+
+
+def main():
+    args = _get_args()
+    os.makedirs(args.output_dir, exist_ok=True)
+    client = get_client(args.endpoint_url, args.workers)
+    conn = sqlite3.connect(args.index or os.path.join(args.output_dir, DEFAULT_INDEX))
+    try:
+        cursor = create_schema(conn)
+        location = _s3_location(args.target)
+        if location:
+            key, modified, metadata, written = _format_downloaded(
+                location[1], _fetch(client, *location), args.output_dir
+            )
+            add_bloblog(cursor, key, modified, metadata, written, args.output_dir)
+            _print_written(written)
+            return 0
+        if os.path.isfile(args.target):
+            _print_written(format_file(args.target)[1])
+            return 0
+
+        end = args.end or datetime.now().astimezone()
+        start = args.start
+        if args.hours_back is not None:
+            start = end - timedelta(hours=args.hours_back)
+        bucket, prefix = BLOBLOGS_LOCATIONS[args.env]
+        print(
+            f"Getting bloblogs for user ID {args.target} between {start} and {end} using {args.env}"
+        )
+        count = 0
+        for key, modified, metadata, written in get_user_bloblogs(
+            client,
+            bucket,
+            prefix,
+            args.target,
+            start,
+            end,
+            args.output_dir,
+            args.workers,
+            args.format_workers,
+        ):
+            add_bloblog(cursor, key, modified, metadata, written, args.output_dir)
+            print(f"  {os.path.basename(key)}")
+            _print_written(written)
+            count += 1
+        print(f"{count} bloblogs saved to {args.output_dir}")
+    except (BotoCoreError, ClientError) as e:
+        print(e)
+        print(AWS_MFA_WARNING)
+        return 1
+    finally:
+        # What was fetched before a failure stays searchable
+        conn.commit()
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,81 +1,276 @@
+import argparse
 import json
 import sqlite3
 import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
 from glob import iglob
+from itertools import islice, repeat
 from sqlite3 import Error
 
+try:
+    # orjson is several times faster than the stdlib parser but is optional
+    from orjson import loads as json_loads  # type: ignore
+except ImportError:
+    json_loads = json.loads
+
+DEFAULT_CHUNK_SIZE = 500
+
+ALERT_TABLES = ("lumo", "flightstats")
+
 
 def create_schema(conn):
     c = conn.cursor()
+    for table in ALERT_TABLES:
+        # The raw notification lives in its own table so that lookups by booking
+        # only page in the small columns
+        c.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {table} (refid TEXT, request_id TEXT, type TEXT, reportedTime TEXT, reportedEpoch REAL, ourTime REAL)
+            """
+        )
+        c.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {table}_notification (request_id TEXT PRIMARY KEY, notification TEXT)
+            """
+        )
+        c.execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS {table}_refid_our_time ON {table} (refid, ourTime)
+            """
+        )
+        _drop_duplicate_requests(c, table)
+        c.execute(
+            f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS {table}_request_id ON {table} (request_id)
+            """
+        )
+        _add_reported_epoch(c, table)
+    # Source files already loaded, a file is loaded again if its mtime changes
     c.execute(
         """
-        CREATE TABLE lumo (refid TEXT, type TEXT, request_id TEXT, reportedTime TEXT, ourTime REAL, notification TEXT)
+        CREATE TABLE IF NOT EXISTS ingested_files (path TEXT PRIMARY KEY, mtime REAL)
         """
     )
-    c.execute(
+    return c
+
+
+def _drop_duplicate_requests(cursor, table):
+    # Loaders before the unique request_id index could insert a request more
+    # than once, which would make creating the index fail. The first row of
+    # every request_id is kept. Once the index exists there can't be any
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+        (f"{table}_request_id",),
+    )
+    if cursor.fetchone():
+        return
+    cursor.execute(
+        f"""
+        DELETE FROM {table} WHERE request_id IS NOT NULL AND rowid NOT IN (
+            SELECT min(rowid) FROM {table} WHERE request_id IS NOT NULL GROUP BY request_id
+        )
         """
-        CREATE TABLE flightstats (refid TEXT, request_id TEXT, type TEXT, reportedTime TEXT, ourTime REAL, notification TEXT)
+    )
+
+
+def _add_reported_epoch(cursor, table):
+    # Databases created before reportedEpoch existed get the column added and
+    # backfilled in one statement, letting sqlite parse the timestamps. Rows
+    # inserted since always have it, so this only runs once per database
+    cursor.execute(f"PRAGMA table_info({table})")
+    if "reportedEpoch" in [column[1] for column in cursor.fetchall()]:
+        return
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN reportedEpoch REAL")
+    cursor.execute(
+        f"""
+        UPDATE {table} SET reportedEpoch = CASE
+            WHEN reportedTime GLOB '*-*' THEN
+                CAST(strftime('%s', replace(rtrim(reportedTime, 'Z'), 'T', ' ')) AS REAL)
+                + CAST(rtrim(substr(reportedTime, 20), 'Z') AS REAL)
+            ELSE CAST(reportedTime AS REAL)
+        END
+        WHERE reportedEpoch IS NULL
         """
     )
-    return c
 
 
-def _yield_logs_in_dir(dirname):
-    for f in iglob(
+def reported_epoch(reported_time):
+    # Alerts report either epoch seconds or 2020-03-13T15:18:56(.19)Z
+    try:
+        return float(reported_time)
+    except ValueError:
+        pass
+    seconds, _, fraction = reported_time.rstrip("Z").partition(".")
+    epoch = datetime.fromisoformat(seconds).replace(tzinfo=timezone.utc).timestamp()
+    return epoch + float(f"0.{fraction}") if fraction else epoch
+
+
+# A booking's alerts in the order we received them
+FETCH_ALERTS_QUERY = (
+    "SELECT type, reportedEpoch from {table} where refid = ? order by ourTime"
+)
+
+
+def fetch_alerts(cursor, table, refid):
+    cursor.execute(FETCH_ALERTS_QUERY.format(table=table), (refid,))
+    return cursor.fetchall()
+
+
+def _iter_log_paths(dirname):
+    return iglob(
         os.path.join(os.path.dirname(os.path.realpath(__file__)), dirname, r"*.json")
-    ):
-        with open(f) as infile:
-            yield json.load(infile)
+    )
 
 
-def add_lumo_logs(cursor):
-    for log in _yield_logs_in_dir("lumo-logs"):
-        alert = log["data"]["alert"]
-        cursor.execute(
-            """
-            INSERT INTO lumo VALUES(?, ?, ?, ?, ?)
-            """,
-            (
-                alert["booking_reference"].replace("production", ""),
-                log["request_id"],
-                alert["change"],
-                alert["timestamp"],
-                float(log["_created"]),
-                json.dumps(log["data"]),
-            ),
-        )
+def ingested_files(cursor):
+    cursor.execute("SELECT path, mtime from ingested_files")
+    return dict(cursor.fetchall())
 
 
-def add_flightstats_logs(cursor):
-    for log in _yield_logs_in_dir("flightstats-logs"):
-        alert = json.loads(log["data"])
-        cursor.execute(
-            """
-            INSERT INTO flightstats VALUES(?, ?, ?, ?, ?)
+def _new_log_files(cursor, dirname):
+    ingested = ingested_files(cursor)
+    new_files = []
+    for path in _iter_log_paths(dirname):
+        mtime = os.stat(path).st_mtime
+        if ingested.get(path) != mtime:
+            new_files.append((path, mtime))
+    return new_files
+
+
+def mark_ingested(cursor, files):
+    cursor.executemany(
+        """
+        INSERT INTO ingested_files (path, mtime) VALUES(?, ?)
+        ON CONFLICT(path) DO UPDATE SET mtime = excluded.mtime
+        """,
+        files,
+    )
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def lumo_row(log):
+    alert = log["data"]["alert"]
+    return (
+        alert["booking_reference"].replace("production", ""),
+        log["request_id"],
+        alert["change"],
+        alert["timestamp"],
+        reported_epoch(alert["timestamp"]),
+        float(log["_created"]),
+        json.dumps(log["data"]),
+    )
+
+
+def flightstats_row(log):
+    alert = json_loads(log["data"])
+    return (
+        alert["trip"]["referenceNumber"],
+        log["request_id"],
+        alert["alertDetails"]["type"],
+        alert["alertDetails"]["dateTime"],
+        reported_epoch(alert["alertDetails"]["dateTime"]),
+        float(log["_created"]),
+        log["data"],
+    )
+
+
+def _parse_chunk(paths, extract_row):
+    # Runs in a worker process, only the extracted tuples are sent back
+    rows = []
+    for path in paths:
+        with open(path, "rb") as infile:
+            rows.append(extract_row(json_loads(infile.read())))
+    return rows
+
+
+def _yield_rows(paths, extract_row, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    chunks = chunked(paths, chunk_size)
+    if workers == 1:
+        for chunk in chunks:
+            yield from _parse_chunk(chunk, extract_row)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for rows in executor.map(_parse_chunk, chunks, repeat(extract_row)):
+            yield from rows
+
+
+def insert_alerts(cursor, table, rows, batch_size=DEFAULT_CHUNK_SIZE):
+    for batch in chunked(rows, batch_size):
+        cursor.executemany(
+            f"""
+            INSERT INTO {table} (refid, request_id, type, reportedTime, reportedEpoch, ourTime)
+            VALUES(?, ?, ?, ?, ?, ?)
+            ON CONFLICT(request_id) DO UPDATE SET
+                refid = excluded.refid,
+                type = excluded.type,
+                reportedTime = excluded.reportedTime,
+                reportedEpoch = excluded.reportedEpoch,
+                ourTime = excluded.ourTime
+            """,
+            [row[:-1] for row in batch],
+        )
+        cursor.executemany(
+            f"""
+            INSERT INTO {table}_notification (request_id, notification) VALUES(?, ?)
+            ON CONFLICT(request_id) DO UPDATE SET notification = excluded.notification
             """,
-            (
-                alert["trip"]["referenceNumber"],
-                log["request_id"],
-                alert["alertDetails"]["type"],
-                alert["alertDetails"]["dateTime"],
-                float(log["_created"]),
-                log["data"],
-            ),
+            [(row[1], row[-1]) for row in batch],
         )
 
 
-def create_database(db_file):
+def _add_logs(cursor, table, dirname, extract_row, workers, chunk_size):
+    new_files = _new_log_files(cursor, dirname)
+    insert_alerts(
+        cursor,
+        table,
+        _yield_rows([path for path, _ in new_files], extract_row, workers, chunk_size),
+    )
+    mark_ingested(cursor, new_files)
+    return len(new_files)
+
+
+def add_lumo_logs(cursor, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    return _add_logs(cursor, "lumo", "lumo-logs", lumo_row, workers, chunk_size)
+
+
+def add_flightstats_logs(cursor, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    return _add_logs(
+        cursor,
+        "flightstats",
+        "flightstats-logs",
+        flightstats_row,
+        workers,
+        chunk_size,
+    )
+
+
+def create_database(db_file, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
     # Logs are pulled down from s3
-    # aws s3 cp --recursive s3://bloblogs.ops.lola.com/blobs/production/flightstats-alert flightstats-logs
-    # aws s3 cp --recursive s3://bloblogs.ops.lola.com/blobs/production/lumo-alert/ lumo-logs
+    # aws s3 sync s3://bloblogs.ops.lola.com/blobs/production/flightstats-alert flightstats-logs
+    # aws s3 sync s3://bloblogs.ops.lola.com/blobs/production/lumo-alert/ lumo-logs
     # They are not committed to the repo
+    # s3_logs_to_database.py loads them straight from s3 without the local copy
+    # Files are decoded in a process pool, this process is the only sqlite writer
+    # Loading is incremental: only files not seen before (or modified since) are
+    # read and rows are upserted on request_id, so this is safe to rerun from cron
     conn = None
     try:
         conn = sqlite3.connect(db_file)
         cursor = create_schema(conn)
-        add_lumo_logs(cursor)
-        add_flightstats_logs(cursor)
+        lumo_count = add_lumo_logs(cursor, workers, chunk_size)
+        flightstats_count = add_flightstats_logs(cursor, workers, chunk_size)
         conn.commit()
+        print(
+            f"Loaded {lumo_count} new lumo and {flightstats_count} new flightstats logs"
+        )
     except Error as e:
         print(e)
     finally:
@@ -83,7 +278,27 @@ def create_database(db_file):
             conn.close()
 
 
+def _get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Decoder processes, defaults to one per core. 1 disables the pool",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="How many files each worker decodes per task",
+    )
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = _get_args()
     create_database(
-        os.path.join(os.path.dirname(os.path.realpath(__file__)), "logsdb.sqlite")
+        os.path.join(os.path.dirname(os.path.realpath(__file__)), "logsdb.sqlite"),
+        args.workers,
+        args.chunk_size,
     )
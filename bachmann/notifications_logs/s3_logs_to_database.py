@@ -0,0 +1,172 @@
+import argparse
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from sqlite3 import Error
+
+import boto3  # type: ignore
+from botocore.config import Config  # type: ignore
+
+from logs_to_database import (
+    DEFAULT_CHUNK_SIZE,
+    chunked,
+    create_schema,
+    flightstats_row,
+    ingested_files,
+    insert_alerts,
+    json_loads,
+    lumo_row,
+    mark_ingested,
+)
+
+BLOBLOGS_BUCKET = "bloblogs.ops.lola.com"
+BLOBLOGS_PREFIX = "blobs/production"
+DEFAULT_WORKERS = 32
+
+# table -> (alert folder in the bucket, row extractor)
+ALERT_SOURCES = {
+    "lumo": ("lumo-alert", lumo_row),
+    "flightstats": ("flightstats-alert", flightstats_row),
+}
+
+
+def _parse_date(value):
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+
+def _get_args():
+    parser = argparse.ArgumentParser(
+        description="Stream alert bloblogs from s3 straight into logsdb.sqlite"
+    )
+    parser.add_argument("--bucket", default=BLOBLOGS_BUCKET)
+    parser.add_argument("--prefix", default=BLOBLOGS_PREFIX)
+    parser.add_argument(
+        "--endpoint-url", help="Alternative s3 endpoint, e.g. a local minio"
+    )
+    parser.add_argument(
+        "--since",
+        type=_parse_date,
+        help="Only load objects modified at or after this UTC date (2020-03-13 or 2020-03-13T15:00)",
+    )
+    parser.add_argument(
+        "--until",
+        type=_parse_date,
+        help="Only load objects modified before this UTC date",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Concurrent downloads, also the size of the connection pool",
+    )
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument(
+        "--table",
+        dest="tables",
+        action="append",
+        choices=list(ALERT_SOURCES.keys()),
+        help="Which alerts to load, can be repeated. Defaults to all of them",
+    )
+    return parser.parse_args()
+
+
+def get_client(endpoint_url=None, workers=DEFAULT_WORKERS):
+    return boto3.client(
+        "s3",
+        endpoint_url=endpoint_url,
+        config=Config(max_pool_connections=workers),
+    )
+
+
+def list_objects(client, bucket, prefix, since=None, until=None):
+    # Streams the listing a page at a time, only objects modified in
+    # [since, until) are yielded
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            modified = obj["LastModified"]
+            if (since and modified < since) or (until and modified >= until):
+                continue
+            yield obj
+
+
+def list_new_objects(client, bucket, prefix, ingested, since=None, until=None):
+    for obj in list_objects(client, bucket, prefix, since, until):
+        path = f"s3://{bucket}/{obj['Key']}"
+        mtime = obj["LastModified"].timestamp()
+        if ingested.get(path) != mtime:
+            yield obj["Key"], path, mtime
+
+
+def _fetch_row(client, bucket, key, extract_row):
+    body = client.get_object(Bucket=bucket, Key=key)["Body"]
+    return extract_row(json_loads(body.read()))
+
+
+def add_s3_logs(
+    cursor,
+    client,
+    table,
+    bucket=BLOBLOGS_BUCKET,
+    prefix=BLOBLOGS_PREFIX,
+    since=None,
+    until=None,
+    workers=DEFAULT_WORKERS,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+):
+    folder, extract_row = ALERT_SOURCES[table]
+    objects = list_new_objects(
+        client,
+        bucket,
+        f"{prefix.rstrip('/')}/{folder}/",
+        ingested_files(cursor),
+        since,
+        until,
+    )
+    count = 0
+    # Objects are fetched a chunk at a time so nothing but the current chunk is
+    # held in memory and nothing touches the disk besides the db
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk in chunked(objects, chunk_size):
+            rows = executor.map(
+                lambda obj: _fetch_row(client, bucket, obj[0], extract_row), chunk
+            )
+            insert_alerts(cursor, table, rows, chunk_size)
+            mark_ingested(cursor, [(path, mtime) for _, path, mtime in chunk])
+            count += len(chunk)
+    return count
+
+
+def main():
+    args = _get_args()
+    client = get_client(args.endpoint_url, args.workers)
+    conn = None
+    try:
+        conn = sqlite3.connect(
+            os.path.join(os.path.dirname(os.path.realpath(__file__)), "logsdb.sqlite")
+        )
+        cursor = create_schema(conn)
+        for table in args.tables or ALERT_SOURCES.keys():
+            count = add_s3_logs(
+                cursor,
+                client,
+                table,
+                args.bucket,
+                args.prefix,
+                args.since,
+                args.until,
+                args.workers,
+                args.chunk_size,
+            )
+            conn.commit()
+            print(f"Loaded {count} new {table} logs")
+    except Error as e:
+        print(e)
+    finally:
+        if conn:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
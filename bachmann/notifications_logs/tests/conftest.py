@@ -0,0 +1,34 @@
+import pytest
+from moto import mock_aws
+
+from s3_logs_to_database import get_client
+
+BUCKET = "bloblogs-test"
+
+
+@pytest.fixture
+def bucket():
+    return BUCKET
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        client = get_client(workers=4)
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.fixture
+def put_object(client, monkeypatch):
+    def put(key, body, modified):
+        # moto stamps LastModified with its own utcnow
+        monkeypatch.setattr(
+            "moto.s3.models.utcnow", lambda: modified.replace(tzinfo=None)
+        )
+        client.put_object(Bucket=BUCKET, Key=key, Body=body)
+
+    return put
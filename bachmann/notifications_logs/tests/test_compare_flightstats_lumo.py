@@ -0,0 +1,67 @@
+import csv
+import io
+import sqlite3
+
+from compare_flightstats_lumo import compare_bookings, match_alerts
+from logs_to_database import create_schema, insert_alerts
+
+
+def _row(refid, request_id, alert_type, our_time):
+    return (refid, request_id, alert_type, "0", 0.0, our_time, "{}")
+
+
+def test_match_alerts_maps_types():
+    matches, unmapped = match_alerts(
+        [
+            ("B1", "lumo", "gate_change", 10.0),
+            ("B1", "flightstats", "DEPARTURE_GATE", 4.0),
+            ("B1", "lumo", "DEPARTURE_DELAY", 20.0),
+            ("B1", "lumo", "SOMETHING_NEW", 30.0),
+            ("B1", "flightstats", "BAGGAGE", 31.0),
+        ]
+    )
+
+    assert matches == [
+        ("DEPARTURE_DELAY", 20.0, None),
+        ("DEPARTURE_GATE", 10.0, 4.0),
+    ]
+    assert unmapped == [("lumo", "SOMETHING_NEW"), ("flightstats", "BAGGAGE")]
+
+
+def test_compare_bookings():
+    cursor = create_schema(sqlite3.connect(":memory:"))
+    insert_alerts(
+        cursor,
+        "lumo",
+        [
+            _row("B1", "l1", "CANCELLED", 100.0),
+            _row("B2", "l2", "DEPARTURE_DELAY", 50.0),
+            _row("B2", "l3", "SOMETHING_NEW", 60.0),
+        ],
+    )
+    insert_alerts(
+        cursor,
+        "flightstats",
+        [
+            _row("B1", "f1", "CANCELLED", 90.0),
+            _row("B2", "f2", "BAGGAGE", 55.0),
+        ],
+    )
+    outfile = io.StringIO()
+
+    bookings, stats_by_type, unmapped_counts = compare_bookings(cursor, outfile)
+
+    assert bookings == 2
+    assert stats_by_type == {
+        "CANCELLED": {"deltas": [10.0], "lumo_only": 0, "flightstats_only": 0},
+        "DEPARTURE_DELAY": {"deltas": [], "lumo_only": 1, "flightstats_only": 0},
+    }
+    assert unmapped_counts == {
+        ("lumo", "SOMETHING_NEW"): 1,
+        ("flightstats", "BAGGAGE"): 1,
+    }
+    rows = list(csv.reader(io.StringIO(outfile.getvalue())))
+    assert rows[1:] == [
+        ["B1", "CANCELLED", "100.0", "90.0", "10.0"],
+        ["B2", "DEPARTURE_DELAY", "50.0", "", ""],
+    ]
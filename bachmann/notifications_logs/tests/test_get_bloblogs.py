@@ -0,0 +1,56 @@
+import json
+import os
+from datetime import datetime, timezone
+
+from get_bloblogs import get_user_bloblogs
+
+PREFIX = "blobs/production"
+SABRE = "travel-service_Sabre_search.json"
+MARCH_12 = datetime(2020, 3, 12, tzinfo=timezone.utc)
+MARCH_13 = datetime(2020, 3, 13, tzinfo=timezone.utc)
+MARCH_14 = datetime(2020, 3, 14, tzinfo=timezone.utc)
+
+
+def test_get_user_bloblogs(client, bucket, put_object, tmp_path):
+    sabre = {"search_id": "s1", "user_id": "u1", "body": {"origin": "SFO"}}
+    put_object(f"{PREFIX}/u1/early.json", b"{}", MARCH_12)
+    put_object(f"{PREFIX}/u1/{SABRE}", json.dumps(sabre).encode(), MARCH_13)
+    put_object(f"{PREFIX}/u1/empty.json", b"", MARCH_13)
+    put_object(f"{PREFIX}/u11/other_user.json", b"{}", MARCH_13)
+    put_object(f"{PREFIX}/u1/late.json", b"{}", MARCH_14)
+
+    results = sorted(
+        get_user_bloblogs(
+            client,
+            bucket,
+            PREFIX,
+            "u1",
+            MARCH_13,
+            MARCH_14,
+            str(tmp_path),
+            workers=2,
+            format_workers=2,
+        )
+    )
+
+    assert [key for key, *_ in results] == [
+        f"{PREFIX}/u1/empty.json",
+        f"{PREFIX}/u1/{SABRE}",
+    ]
+    (_, _, empty_metadata, empty_written), (_, modified, metadata, written) = results
+    # Not json, kept as it was stored
+    assert empty_metadata["search_id"] is None
+    assert empty_written == [("empty.json", "bloblog")]
+    assert modified == MARCH_13.timestamp()
+    assert (metadata["search_id"], metadata["provider"]) == ("s1", "sabre")
+    assert written == [
+        (f"{SABRE}.orig", "bloblog"),
+        ("travel-service_Sabre_search_request.json", "request"),
+    ]
+    assert sorted(os.listdir(tmp_path)) == [
+        "empty.json",
+        f"{SABRE}.orig",
+        "travel-service_Sabre_search_request.json",
+    ]
+    assert (tmp_path / "empty.json").read_bytes() == b""
+    assert json.loads((tmp_path / f"{SABRE}.orig").read_text()) == sabre
@@ -0,0 +1,58 @@
+import sqlite3
+
+from logs_to_database import create_schema, insert_alerts
+
+
+def _old_database():
+    # As the loader before incremental ingestion left it: no reportedEpoch, no
+    # unique request_id and a request loaded twice
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        "CREATE TABLE lumo (refid TEXT, request_id TEXT, type TEXT, reportedTime TEXT, ourTime REAL)"
+    )
+    conn.executemany(
+        "INSERT INTO lumo VALUES (?, ?, ?, ?, ?)",
+        [
+            ("B1", "r1", "CANCELLED", "1584112736", 1.0),
+            ("B1", "r1", "CANCELLED", "1584112736", 2.0),
+            ("B2", "r2", "DEPARTURE_DELAY", "2020-03-13T15:18:56Z", 3.0),
+            ("B3", None, "DIVERTED", "1584112736", 4.0),
+            ("B3", None, "DIVERTED", "1584112736", 5.0),
+        ],
+    )
+    return conn
+
+
+def _alerts(cursor):
+    cursor.execute(
+        "SELECT request_id, ourTime, reportedEpoch FROM lumo ORDER BY ourTime"
+    )
+    return cursor.fetchall()
+
+
+def test_create_schema_upgrades_old_database():
+    cursor = create_schema(_old_database())
+
+    # The first row of a duplicated request is kept, rows without one are left
+    assert _alerts(cursor) == [
+        ("r1", 1.0, 1584112736.0),
+        ("r2", 3.0, 1584112736.0),
+        (None, 4.0, 1584112736.0),
+        (None, 5.0, 1584112736.0),
+    ]
+
+
+def test_create_schema_upgraded_database_upserts():
+    conn = _old_database()
+    create_schema(conn)
+    cursor = create_schema(conn)
+
+    insert_alerts(
+        cursor,
+        "lumo",
+        [("B1", "r1", "CANCELLED", "1584112736", 1584112736.0, 6.0, "{}")],
+    )
+
+    assert [row for row in _alerts(cursor) if row[0] == "r1"] == [
+        ("r1", 6.0, 1584112736.0)
+    ]
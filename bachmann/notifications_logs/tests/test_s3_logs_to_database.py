@@ -0,0 +1,88 @@
+import json
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+
+from logs_to_database import create_schema
+from s3_logs_to_database import add_s3_logs, list_objects
+
+PREFIX = "blobs/production"
+MARCH_12 = datetime(2020, 3, 12, tzinfo=timezone.utc)
+MARCH_13 = datetime(2020, 3, 13, tzinfo=timezone.utc)
+MARCH_14 = datetime(2020, 3, 14, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def cursor():
+    conn = sqlite3.connect(":memory:")
+    yield create_schema(conn)
+    conn.close()
+
+
+@pytest.fixture
+def put_alert(put_object):
+    def put(request_id, modified):
+        log = {
+            "request_id": request_id,
+            "_created": "1584112736.5",
+            "data": {
+                "alert": {
+                    "booking_reference": "productionABC123",
+                    "change": "DELAY",
+                    "timestamp": "2020-03-13T15:18:56Z",
+                }
+            },
+        }
+        put_object(
+            f"{PREFIX}/lumo-alert/{request_id}.json", json.dumps(log).encode(), modified
+        )
+
+    return put
+
+
+def _request_ids(cursor):
+    cursor.execute("SELECT request_id FROM lumo ORDER BY request_id")
+    return [request_id for (request_id,) in cursor.fetchall()]
+
+
+def test_list_objects_bounds(client, bucket, put_alert):
+    put_alert("early", MARCH_12)
+    put_alert("since", MARCH_13)
+    put_alert("until", MARCH_14)
+
+    keys = [
+        obj["Key"]
+        for obj in list_objects(
+            client, bucket, f"{PREFIX}/lumo-alert/", MARCH_13, MARCH_14
+        )
+    ]
+
+    assert keys == [f"{PREFIX}/lumo-alert/since.json"]
+
+
+def test_add_s3_logs(client, bucket, cursor, put_alert):
+    put_alert("a", MARCH_13)
+    put_alert("b", MARCH_13)
+    put_alert("late", MARCH_14)
+
+    count = add_s3_logs(
+        cursor, client, "lumo", bucket, PREFIX, until=MARCH_14, chunk_size=1
+    )
+
+    assert count == 2
+    assert _request_ids(cursor) == ["a", "b"]
+
+
+def test_add_s3_logs_skips_ingested(client, bucket, cursor, put_alert):
+    put_alert("a", MARCH_12)
+    put_alert("b", MARCH_12)
+    assert add_s3_logs(cursor, client, "lumo", bucket, PREFIX) == 2
+
+    # A rerun with nothing new loads nothing
+    assert add_s3_logs(cursor, client, "lumo", bucket, PREFIX) == 0
+
+    put_alert("c", MARCH_13)
+    assert add_s3_logs(cursor, client, "lumo", bucket, PREFIX) == 1
+    assert add_s3_logs(cursor, client, "lumo", bucket, PREFIX) == 0
+    assert _request_ids(cursor) == ["a", "b", "c"]
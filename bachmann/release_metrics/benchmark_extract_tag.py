@@ -0,0 +1,119 @@
+import argparse
+import random
+import re
+import sys
+import time
+from urllib.parse import urlparse
+
+from extract_releases import JENKINS_BOT_ID, iter_releases
+
+PROJECTS = ["booking-service", "flights-api", "hotel-search", "web-frontend"]
+ENVIRONMENTS = ["Production", "Staging", "QA"]
+# Shapes of tag links seen in the channel, plus a few urlparse has to agree on
+LINK_FORMATS = [
+    "https://hub.docker.com/r/lolatravel/{project}:{tag}",
+    "https://hub.docker.com/r/lolatravel/{project}:{tag}|{project}:{tag}",
+    "https://registry.lola.com/v2/lolatravel/{project}:{tag}?digest=sha256",
+    "https://registry.lola.com/v2/lolatravel/{project}:{tag};v=2#latest",
+    "https://registry.lola.com/{project}",
+    "s3://artifacts/{project}:{tag}",
+]
+
+
+def _get_args():
+    parser = argparse.ArgumentParser(
+        description="Time release tag extraction over a synthetic #release history"
+    )
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument(
+        "--jenkins-ratio",
+        type=float,
+        default=0.6,
+        help="Share of messages posted by the Jenkins bot",
+    )
+    return parser.parse_args()
+
+
+def reference_extract_tag(release_message):
+    # extract_tag as it was before the fast path, kept to check the output
+    # is unchanged. The match guard is new, the old one failed on a missing link
+    if not release_message.startswith("Production"):
+        return None, None
+    match = re.search(r"<(.*)>", release_message)
+    if not match:
+        return None, None
+    url = match.group(1)
+    tag_parts = urlparse(url).path.split("/")[-1].split(":")
+    try:
+        return tag_parts[0], tag_parts[1]
+    except IndexError:
+        return None, None
+
+
+def reference_iter_releases(history):
+    for message in history:
+        if (
+            message.get("bot_id") == JENKINS_BOT_ID
+            and message["subtype"] == "bot_message"
+        ):
+            timestamp = message["ts"]
+            project, tag = reference_extract_tag(
+                message["attachments"][0]["fields"][0]["value"]
+            )
+            if project and tag:
+                yield {"timestamp": timestamp, "project": project, "tag": tag}
+
+
+def _release_value():
+    project = random.choice(PROJECTS)
+    tag = f"{random.randrange(1000)}-{random.getrandbits(28):07x}"
+    link = random.choice(LINK_FORMATS).format(project=project, tag=tag)
+    value = f"{random.choice(ENVIRONMENTS)} deploy of <{link}>"
+    if random.random() < 0.01:
+        value += "\nTriggered by <https://jenkins.lola.com/job/deploy/|jenkins>"
+    return value
+
+
+def synthetic_history(messages, jenkins_ratio):
+    history = []
+    for i in range(messages):
+        ts = f"{1580000000 + i}.000100"
+        if random.random() < jenkins_ratio:
+            history.append(
+                {
+                    "ts": ts,
+                    "bot_id": JENKINS_BOT_ID,
+                    "subtype": "bot_message",
+                    "attachments": [{"fields": [{"value": _release_value()}]}],
+                }
+            )
+        else:
+            history.append({"ts": ts, "type": "message", "text": "shipping it"})
+    return history
+
+
+def _time(iter_releases_fn, history):
+    start = time.perf_counter()
+    releases = list(iter_releases_fn(history))
+    return time.perf_counter() - start, releases
+
+
+def main():
+    args = _get_args()
+    print(f"Generating {args.messages} messages")
+    history = synthetic_history(args.messages, args.jenkins_ratio)
+
+    reference_elapsed, expected = _time(reference_iter_releases, history)
+    elapsed, releases = _time(iter_releases, history)
+    if releases != expected:
+        print("Fast path and reference extraction disagree")
+        return 1
+
+    print(f"{len(releases)} releases extracted")
+    print(f"reference: {reference_elapsed:.3f}s")
+    print(f"fast path: {elapsed:.3f}s ({reference_elapsed / elapsed:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
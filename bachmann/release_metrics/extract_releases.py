@@ -1,44 +1,111 @@
+import argparse
 import json
+import os
 import re
+import sys
 from urllib.parse import urlparse
 
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "slack_exporter")
+)
+from slack_archive import iter_messages  # noqa: E402
+
 JENKINS_BOT_ID = "BNJDGC42C"
+RELEASES_FILE = "releases.json"
+# Release times are reported in this timezone unless --timezone says otherwise
+DEFAULT_TIMEZONE = "America/New_York"
+HISTORY_HELP = (
+    "Read releases straight from an exported #release channel archive "
+    f"instead of {RELEASES_FILE}"
+)
+
+
+# Only used for the rare multi line message, see extract_tag
+TAG_LINK_PATTERN = re.compile(r"<(.*)>")
+
+
+def _tag_link(release_message):
+    if "\n" in release_message:
+        match = TAG_LINK_PATTERN.search(release_message)
+        return match.group(1) if match else None
+    start = release_message.find("<")
+    end = release_message.rfind(">")
+    if start == -1 or end < start:
+        return None
+    return release_message[start + 1 : end]
+
+
+def _url_path_tail(url):
+    # Last path segment the way urlparse would give it: no query, fragment or
+    # ;params. Only plain http(s) links are handled here, anything else (other
+    # schemes, whitespace urlparse would strip) is left to urlparse
+    scheme, separator, rest = url.partition("://")
+    if scheme not in ("http", "https") or "\t" in url or "\r" in url:
+        return urlparse(url).path.split("/")[-1]
+    rest = rest.split("#", 1)[0].split("?", 1)[0]
+    if "/" not in rest:
+        return ""
+    return rest.rsplit("/", 1)[-1].split(";", 1)[0]
 
 
 def extract_tag(release_message):
-    if not release_message.startswith('Production'):
+    # Reject non production messages before doing any parsing
+    if not release_message.startswith("Production"):
         return None, None
-    match = re.search(r"<(.*)>", release_message)
-    url = match.group(1)
-    parsed = urlparse(url)
-    tag_parts = urlparse(url).path.split("/")[-1].split(":")
-    try:
-        return tag_parts[0], tag_parts[1]
-    except IndexError:
+    url = _tag_link(release_message)
+    if url is None:
         return None, None
+    project, _, tag = _url_path_tail(url).partition(":")
+    if not tag:
+        return None, None
+    return project, tag.split(":", 1)[0]
 
 
-def process_history(history):
-    releases = []
+def iter_releases(history):
     for message in history:
         if (
             message.get("bot_id") == JENKINS_BOT_ID
             and message["subtype"] == "bot_message"
         ):
-            timestamp = message["ts"]
             project, tag = extract_tag(message["attachments"][0]["fields"][0]["value"])
             if project and tag:
-                releases.append(
-                    {"timestamp": timestamp, "project": project, "tag": tag}
-                )
-    return releases
+                yield {"timestamp": message["ts"], "project": project, "tag": tag}
+
+
+def process_history(history):
+    return list(iter_releases(history))
+
+
+def iter_archive_releases(path):
+    return iter_releases(iter_messages(path))
+
+
+def load_releases(history=None):
+    # From the archive when there is one, otherwise what main() last extracted
+    if history:
+        return iter_archive_releases(history)
+    with open(RELEASES_FILE) as infile:
+        return json.loads(infile.read())
+
+
+def _get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "history",
+        nargs="?",
+        default="../slack_exporter/release_channel_history.jsonl",
+        help="Exported #release channel archive (.jsonl, .jsonl.gz, .jsonl.zst or legacy .json)",
+    )
+    return parser.parse_args()
 
 
 def main():
-    with open("../slack_exporter/channel_history.json") as infile:
-        history = json.loads(infile.read())
-    with open("releases.json", "w") as outfile:
-        outfile.write(json.dumps(process_history(history), indent=4))
+    args = _get_args()
+    releases = list(iter_archive_releases(args.history))
+    # Archives grown incrementally are not globally ordered, keep newest first
+    releases.sort(key=lambda release: float(release["timestamp"]), reverse=True)
+    with open(RELEASES_FILE, "w") as outfile:
+        outfile.write(json.dumps(releases, indent=4))
 
 
 if __name__ == "__main__":
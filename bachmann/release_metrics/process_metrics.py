@@ -1,61 +1,117 @@
+import argparse
 import datetime
 import json
+from zoneinfo import ZoneInfo
 
+from extract_releases import DEFAULT_TIMEZONE, HISTORY_HELP, load_releases
 
-def group_by_project(releases):
-    projects = {}
-    for release in releases:
-        try:
-            project = projects[release['project']]
-        except KeyError:
-            projects[release['project']] = []
-            project = projects[release['project']]
-        project.append(release)
-
-    return projects
-
-
-def reverse_project_messages(messages_by_project):
-    for project in messages_by_project.keys():
-        messages_by_project[project].reverse()
-
-
-def compute_metrics(messages):
-    seen_tags = set()
-    fresh_releases = 0
-    repeated_releases = 0
-    for message in messages:
-        tag = message['tag']
-        if tag in seen_tags:
-            repeated_releases += 1
-        else:
-            fresh_releases += 1
-        seen_tags.add(tag)
-    return {
-        'fresh_releases': fresh_releases,
-        'repeated_releases': repeated_releases,
-        'rollback_percentage': round(repeated_releases / (fresh_releases + repeated_releases), 2)
-    }
-
-
-def process_metrics(releases):
-    start = datetime.datetime.utcfromtimestamp(float(releases[-1]['timestamp'])) + datetime.timedelta(hours=-5)
-    end = datetime.datetime.utcfromtimestamp(float(releases[0]['timestamp'])) + datetime.timedelta(hours=-5)
-    messages_by_project = group_by_project(releases)
-    reverse_project_messages(messages_by_project)
-    metrics_by_project = {}
-    for project, messages in messages_by_project.items():
-        metrics_by_project[project] = compute_metrics(messages)
-    return start, end, metrics_by_project
+
+class ReleaseMetrics:
+    # Fresh releases are the distinct tags deployed per project and every other
+    # deploy is a repeat (a rollback), so the counts don't depend on the order
+    # releases arrive in and nothing but the seen tags is kept around
+    def __init__(self, state=None):
+        state = state or {}
+        self.projects = {
+            project: {"releases": counts["releases"], "tags": set(counts["tags"])}
+            for project, counts in state.get("projects", {}).items()
+        }
+        self.oldest_ts = state.get("oldest_ts")
+        self.newest_ts = state.get("newest_ts")
+
+    def add(self, release):
+        timestamp = float(release["timestamp"])
+        if self.oldest_ts is None or timestamp < self.oldest_ts:
+            self.oldest_ts = timestamp
+        if self.newest_ts is None or timestamp > self.newest_ts:
+            self.newest_ts = timestamp
+        project = self.projects.setdefault(
+            release["project"], {"releases": 0, "tags": set()}
+        )
+        project["releases"] += 1
+        project["tags"].add(release["tag"])
+
+    def update(self, releases):
+        # Only releases newer than what has been counted, e.g. from an
+        # incrementally exported archive
+        newest_ts = self.newest_ts
+        for release in releases:
+            if newest_ts is None or float(release["timestamp"]) > newest_ts:
+                self.add(release)
+        return self
+
+    def metrics(self):
+        metrics_by_project = {}
+        for project, counts in self.projects.items():
+            fresh_releases = len(counts["tags"])
+            repeated_releases = counts["releases"] - fresh_releases
+            metrics_by_project[project] = {
+                "fresh_releases": fresh_releases,
+                "repeated_releases": repeated_releases,
+                "rollback_percentage": round(repeated_releases / counts["releases"], 2),
+            }
+        return metrics_by_project
+
+    def to_state(self):
+        return {
+            "projects": {
+                project: {
+                    "releases": counts["releases"],
+                    "tags": sorted(counts["tags"]),
+                }
+                for project, counts in self.projects.items()
+            },
+            "oldest_ts": self.oldest_ts,
+            "newest_ts": self.newest_ts,
+        }
+
+
+def process_metrics(releases, aggregator=None, timezone=ZoneInfo(DEFAULT_TIMEZONE)):
+    aggregator = (aggregator or ReleaseMetrics()).update(releases)
+    if aggregator.newest_ts is None:
+        # Nothing released yet, or no release messages in the archive
+        return None, None, {}
+    start = datetime.datetime.fromtimestamp(aggregator.oldest_ts, timezone)
+    end = datetime.datetime.fromtimestamp(aggregator.newest_ts, timezone)
+    return start, end, aggregator.metrics()
+
+
+def _get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--history",
+        help=HISTORY_HELP,
+    )
+    parser.add_argument(
+        "--state",
+        help="Keep running counts in this file and only add releases newer than it",
+    )
+    parser.add_argument("--timezone", type=ZoneInfo, default=ZoneInfo(DEFAULT_TIMEZONE))
+    return parser.parse_args()
 
 
 def main():
-    with open('releases.json') as infile:
-        releases = json.loads(infile.read())
-        start, end, metrics = process_metrics(releases)
+    args = _get_args()
+    aggregator = None
+    if args.state:
+        try:
+            with open(args.state) as infile:
+                aggregator = ReleaseMetrics(json.loads(infile.read()))
+        except FileNotFoundError:
+            pass
+    aggregator = aggregator or ReleaseMetrics()
+    start, end, metrics = process_metrics(
+        load_releases(args.history), aggregator, args.timezone
+    )
+    if start is None:
+        print("No releases to process")
+    else:
         print(f"Processed from {start} to {end}")
-        print(json.dumps(metrics, indent=4))
+    print(json.dumps(metrics, indent=4))
+    if args.state:
+        with open(args.state, "w") as outfile:
+            outfile.write(json.dumps(aggregator.to_state()))
 
 
-if __name__  == '__main__':
-    main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from extract_releases import HISTORY_HELP, load_releases
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "release_notes")
+)
+from release_notes.rollback_notes import (  # noqa: E402
+    DEFAULT_CONCURRENCY,
+    find_rollbacks,
+    get_rollback_notes,
+)
+
+
+def _get_args():
+    parser = argparse.ArgumentParser(
+        description="Which PRs every rollback in the #release channel took out"
+    )
+    parser.add_argument(
+        "--history",
+        help=HISTORY_HELP,
+    )
+    parser.add_argument("--project", dest="projects", action="append")
+    parser.add_argument(
+        "--repo",
+        dest="repos",
+        action="append",
+        default=[],
+        metavar="PROJECT=REPO",
+        help="Github repo of a project when it isn't deployed under the repo name",
+    )
+    parser.add_argument(
+        "--cache",
+        default="rollback_notes_cache.json",
+        help="Release notes already looked up, only new commit ranges are queried",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="Commit ranges queried against github and jira at once",
+    )
+    return parser.parse_args()
+
+
+def _load_cache(path):
+    try:
+        with open(path) as infile:
+            return json.loads(infile.read())
+    except FileNotFoundError:
+        return {}
+
+
+def main():
+    args = _get_args()
+    rollbacks = [
+        rollback
+        for rollback in find_rollbacks(load_releases(args.history))
+        if not args.projects or rollback["project"] in args.projects
+    ]
+    cache = _load_cache(args.cache)
+    cached = len(cache)
+    try:
+        report = asyncio.run(
+            get_rollback_notes(
+                rollbacks,
+                cache,
+                args.concurrency,
+                dict(repo.split("=", 1) for repo in args.repos),
+            )
+        )
+    finally:
+        # Keep whatever was looked up even if the run is interrupted
+        with open(args.cache, "w") as outfile:
+            outfile.write(json.dumps(cache))
+    print(f"{len(report)} rollbacks, {len(cache) - cached} commit ranges looked up")
+    report.sort(key=lambda rollback: float(rollback["timestamp"]), reverse=True)
+    with open("rollbacks.json", "w") as outfile:
+        outfile.write(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
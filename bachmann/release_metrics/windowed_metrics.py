@@ -0,0 +1,173 @@
+import argparse
+import bisect
+import csv
+import datetime
+import json
+import sys
+from zoneinfo import ZoneInfo
+
+from extract_releases import DEFAULT_TIMEZONE, HISTORY_HELP, load_releases
+
+PERIODS = ("day", "week", "month", "rolling_30d")
+ROLLING_WINDOW = datetime.timedelta(days=30)
+
+
+class ReleaseIndex:
+    # Built with one pass over the releases in time order. Per project it keeps
+    # the sorted release times and a running count of rollbacks (redeploys of
+    # an already seen tag) so any window is answered with two bisects
+    def __init__(self, releases):
+        self.timestamps = {}
+        self.rollbacks = {}
+        seen_tags = {}
+        for release in sorted(
+            releases, key=lambda release: float(release["timestamp"])
+        ):
+            project = release["project"]
+            timestamps = self.timestamps.setdefault(project, [])
+            rollbacks = self.rollbacks.setdefault(project, [0])
+            tags = seen_tags.setdefault(project, set())
+            timestamps.append(float(release["timestamp"]))
+            rollbacks.append(rollbacks[-1] + (release["tag"] in tags))
+            tags.add(release["tag"])
+
+    @property
+    def projects(self):
+        return sorted(self.timestamps.keys())
+
+    @property
+    def first_timestamp(self):
+        return min(timestamps[0] for timestamps in self.timestamps.values())
+
+    @property
+    def last_timestamp(self):
+        return max(timestamps[-1] for timestamps in self.timestamps.values())
+
+    def window(self, project, start, end):
+        timestamps = self.timestamps[project]
+        first = bisect.bisect_left(timestamps, start)
+        last = bisect.bisect_left(timestamps, end)
+        deploys = last - first
+        rollbacks = self.rollbacks[project][last] - self.rollbacks[project][first]
+        hours_between = None
+        if deploys > 1:
+            hours_between = (timestamps[last - 1] - timestamps[first]) / (deploys - 1)
+            hours_between = round(hours_between / 3600, 2)
+        return {
+            "deploys": deploys,
+            "rollbacks": rollbacks,
+            "rollback_rate": round(rollbacks / deploys, 2) if deploys else None,
+            "mean_hours_between_releases": hours_between,
+        }
+
+
+def _start_of(moment, period):
+    moment = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "week":
+        moment -= datetime.timedelta(days=moment.weekday())
+    elif period == "month":
+        moment = moment.replace(day=1)
+    return moment
+
+
+def _next_start(moment, period):
+    if period == "week":
+        return moment + datetime.timedelta(days=7)
+    if period == "month":
+        return (moment.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    return moment + datetime.timedelta(days=1)
+
+
+def period_windows(index, period, timezone):
+    # (label, start, end) in epoch seconds, aligned to midnight in timezone
+    bucket = "day" if period == "rolling_30d" else period
+    moment = _start_of(
+        datetime.datetime.fromtimestamp(index.first_timestamp, timezone), bucket
+    )
+    while moment.timestamp() <= index.last_timestamp:
+        next_moment = _next_start(moment, bucket)
+        start = moment
+        if period == "rolling_30d":
+            # The 30 days up to and including this day
+            start = next_moment - ROLLING_WINDOW
+        yield moment.date(), start.timestamp(), next_moment.timestamp()
+        moment = next_moment
+
+
+def write_rollups(index, periods, timezone, outfile, projects=None):
+    writer = csv.writer(outfile)
+    writer.writerow(
+        [
+            "project",
+            "period",
+            "period_start",
+            "deploys",
+            "rollbacks",
+            "rollback_rate",
+            "mean_hours_between_releases",
+        ]
+    )
+    for period in periods:
+        for label, start, end in period_windows(index, period, timezone):
+            for project in projects or index.projects:
+                metrics = index.window(project, start, end)
+                writer.writerow([project, period, label.isoformat(), *metrics.values()])
+
+
+def _get_args():
+    parser = argparse.ArgumentParser(
+        description="Deploy frequency, rollback rate and time between releases per window"
+    )
+    parser.add_argument(
+        "--history",
+        help=HISTORY_HELP,
+    )
+    parser.add_argument(
+        "--period",
+        dest="periods",
+        action="append",
+        choices=PERIODS,
+        help="Rollups to output, can be repeated. Defaults to all of them",
+    )
+    parser.add_argument("--project", dest="projects", action="append")
+    parser.add_argument(
+        "--window",
+        nargs=2,
+        metavar=("START", "END"),
+        help="Print metrics for one arbitrary window instead, e.g. 2020-01-01 2020-02-15",
+    )
+    parser.add_argument("--timezone", type=ZoneInfo, default=ZoneInfo(DEFAULT_TIMEZONE))
+    return parser.parse_args()
+
+
+def main():
+    args = _get_args()
+    index = ReleaseIndex(load_releases(args.history))
+    if not index.projects:
+        print("No releases found")
+        return 1
+    if args.window:
+        start, end = [
+            datetime.datetime.fromisoformat(value)
+            .replace(tzinfo=args.timezone)
+            .timestamp()
+            for value in args.window
+        ]
+        print(
+            json.dumps(
+                {
+                    project: index.window(project, start, end)
+                    for project in args.projects or index.projects
+                },
+                indent=4,
+            )
+        )
+        return 0
+    write_rollups(
+        index, args.periods or PERIODS, args.timezone, sys.stdout, args.projects
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
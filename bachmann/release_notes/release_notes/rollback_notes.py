@@ -0,0 +1,122 @@
+import asyncio
+from typing import Dict, Iterable, Iterator, List, Optional, Set, TypedDict  # type: ignore
+
+from aiohttp import ClientError
+
+from release_notes import query_release_notes
+from release_notes.query_release_notes import (
+    LOLA_SERVER,
+    TRAVEL_SERVICE,
+    ReleaseNotesResult,
+    extract_commit_from_docker_tag,
+)
+
+DEFAULT_CONCURRENCY = 8
+
+# Releases are reported per deployment, same mapping get_notes_for_repo uses.
+# Anything else is assumed to be deployed under its repo name
+DEPLOYMENT_REPOS = {
+    "lola-server-web": LOLA_SERVER,
+    "travel-service-api": TRAVEL_SERVICE,
+}
+
+
+class Rollback(TypedDict):
+    timestamp: str
+    project: str
+    rolled_back_tag: str
+    restored_tag: str
+
+
+class RollbackNotes(TypedDict):
+    timestamp: str
+    project: str
+    rolled_back_tag: str
+    restored_tag: str
+    notes: Optional[ReleaseNotesResult]
+    error: Optional[str]
+
+
+def find_rollbacks(releases: Iterable[Dict]) -> Iterator[Rollback]:
+    # A redeploy of a tag already seen while a different tag is live. The PRs
+    # rolled back are the ones between the restored tag and the live one.
+    # Unlike repeated_releases in release_metrics' ReleaseMetrics, redeploying
+    # the tag that is already live is not counted: it takes nothing out, so
+    # there are fewer rollbacks here than repeated releases there
+    seen_tags: Dict[str, Set[str]] = {}
+    live_tags: Dict[str, str] = {}
+    for release in sorted(releases, key=lambda release: float(release["timestamp"])):
+        project = release["project"]
+        tag = release["tag"]
+        tags = seen_tags.setdefault(project, set())
+        live_tag = live_tags.get(project)
+        if tag in tags and live_tag and live_tag != tag:
+            yield Rollback(
+                timestamp=release["timestamp"],
+                project=project,
+                rolled_back_tag=live_tag,
+                restored_tag=tag,
+            )
+        tags.add(tag)
+        live_tags[project] = tag
+
+
+def cache_key(repo: str, current_commit: str, previous_commit: str) -> str:
+    return f"{repo}:{previous_commit}...{current_commit}"
+
+
+async def get_rollback_notes(
+    rollbacks: Iterable[Rollback],
+    cache: Optional[Dict[str, ReleaseNotesResult]] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    repos: Optional[Dict[str, str]] = None,
+) -> List[RollbackNotes]:
+    # Notes between two commits never change so the cache can live across
+    # runs. Every range missing from it is queried once, however many rollbacks
+    # share it, with at most `concurrency` ranges in flight against github/jira
+    cache = {} if cache is None else cache
+    repos = {**DEPLOYMENT_REPOS, **(repos or {})}
+    semaphore = asyncio.Semaphore(concurrency)
+    pending: Dict[str, asyncio.Task] = {}
+
+    async def query_notes(
+        key: str, repo: str, current_commit: str, previous_commit: str
+    ) -> ReleaseNotesResult:
+        async with semaphore:
+            notes = await query_release_notes.get_notes_for_repo_with_commits(
+                repo, current_commit, previous_commit
+            )
+        cache[key] = notes
+        return notes
+
+    async def notes_for(rollback: Rollback) -> RollbackNotes:
+        repo = repos.get(rollback["project"], rollback["project"])
+        current_commit = extract_commit_from_docker_tag(
+            f"{rollback['project']}:{rollback['rolled_back_tag']}"
+        )
+        previous_commit = extract_commit_from_docker_tag(
+            f"{rollback['project']}:{rollback['restored_tag']}"
+        )
+        key = cache_key(repo, current_commit, previous_commit)
+        notes, error = cache.get(key), None
+        if notes is None:
+            if key not in pending:
+                pending[key] = asyncio.ensure_future(
+                    query_notes(key, repo, current_commit, previous_commit)
+                )
+            try:
+                notes = await pending[key]
+            except ClientError as e:
+                # Usually a tag whose commit github doesn't know, report the
+                # rest instead of failing the whole year
+                error = str(e)
+        return RollbackNotes(
+            timestamp=rollback["timestamp"],
+            project=rollback["project"],
+            rolled_back_tag=rollback["rolled_back_tag"],
+            restored_tag=rollback["restored_tag"],
+            notes=notes,
+            error=error,
+        )
+
+    return await asyncio.gather(*[notes_for(rollback) for rollback in rollbacks])
@@ -0,0 +1,96 @@
+import asyncio
+
+from aiohttp import ClientResponseError, RequestInfo
+from yarl import URL
+
+from release_notes import query_release_notes
+from release_notes.rollback_notes import (
+    cache_key,
+    find_rollbacks,
+    get_rollback_notes,
+)
+
+RELEASES = [
+    {"timestamp": "5", "project": "lola-server-web", "tag": "pypy-ccc3333"},
+    {"timestamp": "1", "project": "lola-server-web", "tag": "pypy-aaa1111"},
+    {"timestamp": "2", "project": "lola-server-web", "tag": "pypy-bbb2222"},
+    {"timestamp": "3", "project": "lola-server-web", "tag": "pypy-aaa1111"},
+    {"timestamp": "4", "project": "lola-server-web", "tag": "pypy-aaa1111"},
+    {"timestamp": "2", "project": "lola-desktop", "tag": "test.ddd4444"},
+]
+
+
+def _notes(repo, current_commit, previous_commit):
+    return {
+        "repo": repo,
+        "from_commit": previous_commit,
+        "to_commit": current_commit,
+        "prs": [],
+    }
+
+
+def test_find_rollbacks():
+    assert [
+        {
+            "timestamp": "3",
+            "project": "lola-server-web",
+            "rolled_back_tag": "pypy-bbb2222",
+            "restored_tag": "pypy-aaa1111",
+        }
+    ] == list(find_rollbacks(RELEASES))
+
+
+def test_get_rollback_notes_queries_each_range_once(monkeypatch):
+    calls = []
+
+    async def mock_get_notes_for_repo_with_commits(
+        repo, current_commit, previous_commit
+    ):
+        calls.append((repo, current_commit, previous_commit))
+        await asyncio.sleep(0)
+        return _notes(repo, current_commit, previous_commit)
+
+    monkeypatch.setattr(
+        query_release_notes,
+        "get_notes_for_repo_with_commits",
+        mock_get_notes_for_repo_with_commits,
+    )
+    rollbacks = list(find_rollbacks(RELEASES)) * 3
+    cache = {}
+    result = asyncio.run(get_rollback_notes(rollbacks, cache))
+
+    assert [("lola-server", "bbb2222", "aaa1111")] == calls
+    assert {cache_key("lola-server", "bbb2222", "aaa1111")} == set(cache)
+    assert all(
+        _notes("lola-server", "bbb2222", "aaa1111") == rollback["notes"]
+        for rollback in result
+    )
+
+    asyncio.run(get_rollback_notes(rollbacks, cache))
+    assert 1 == len(calls)
+
+
+def test_get_rollback_notes_reports_failed_ranges(monkeypatch):
+    async def mock_get_notes_for_repo_with_commits(
+        repo, current_commit, previous_commit
+    ):
+        request_info = RequestInfo(
+            URL(f"https://api.github.com/repos/lolatravel/{repo}/compare"), "GET", {}
+        )
+        raise ClientResponseError(request_info, (), status=404, message="Not Found")
+
+    monkeypatch.setattr(
+        query_release_notes,
+        "get_notes_for_repo_with_commits",
+        mock_get_notes_for_repo_with_commits,
+    )
+    cache = {}
+    [result] = asyncio.run(
+        get_rollback_notes(
+            find_rollbacks(RELEASES), cache, repos={"lola-server-web": "batman"}
+        )
+    )
+
+    assert result["notes"] is None
+    assert result["error"].startswith("404")
+    assert {} == cache
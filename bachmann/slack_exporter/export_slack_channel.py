@@ -1,18 +1,33 @@
 import argparse
 import datetime
 import os
+import shutil
+import sys
+import threading
 import uuid
 import time
 import json
 import urllib.parse
 import webbrowser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
 from requests import HTTPError
 
+from message_filters import MESSAGE_FILTERS, apply_filter
+from slack_archive import archive_path, open_archive, write_messages
+
 AUTHORIZE_ENDPOINT = "https://slack.com/oauth/authorize"
 CHANNEL_HISTORY_ENDPOINT = "https://slack.com/api/channels.history"
 OAUTH_ACCESS_ENDPOINT = "https://slack.com/api/oauth.access"
 REDIRECT_URL = "http://localhost:8080"
+# Newest message ts exported per archive, used by --incremental
+EXPORT_STATE_FILE = "export_state.json"
+TOKEN_CACHE_FILE = os.path.expanduser("~/.slack_exporter_token")
+# channels.history is a Tier 3 method, about 50 requests per minute
+HISTORY_REQUESTS_PER_MINUTE = 50
+MAX_ATTEMPTS = 6
+BACKOFF_SECONDS = 1
 
 CHANNELS_IDS = {
     "release": "CLNNTBBB3",
@@ -52,8 +67,50 @@ def authorize_app():
     return result.json()["access_token"]
 
 
-def get_page_history(access_token, latest, oldest, channel):
-    return requests.get(
+def get_access_token(reauthorize=False):
+    if not reauthorize:
+        try:
+            with open(TOKEN_CACHE_FILE) as infile:
+                return infile.read().strip()
+        except FileNotFoundError:
+            pass
+    access_token = authorize_app()
+    # Only readable by us, it grants access to the channel history
+    fd = os.open(TOKEN_CACHE_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as outfile:
+        outfile.write(access_token)
+    return access_token
+
+
+class RateLimiter:
+    # Spaces out calls so that at most requests_per_minute start every minute
+    def __init__(self, requests_per_minute):
+        self.interval = 60 / requests_per_minute
+        self.next_call = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    def back_off(self, seconds):
+        # Slack told us to slow down, nobody sharing this limiter calls before then
+        with self.lock:
+            self.next_call = max(self.next_call, time.monotonic() + seconds)
+
+
+def get_session():
+    session = requests.Session()
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=10))
+    return session
+
+
+def get_page_history(session, access_token, latest, oldest, channel):
+    return session.get(
         CHANNEL_HISTORY_ENDPOINT,
         params={
             "token": access_token,
@@ -67,44 +124,252 @@ def get_page_history(access_token, latest, oldest, channel):
     )
 
 
-def download_data(access_token, channel):
-    messages = []
-    oldest = 0
-    latest = str(time.time())
+def _get_page_with_retries(
+    session, rate_limiter, access_token, latest, oldest, channel
+):
+    for attempt in range(MAX_ATTEMPTS):
+        rate_limiter.wait()
+        backoff = BACKOFF_SECONDS * 2**attempt
+        try:
+            result = get_page_history(session, access_token, latest, oldest, channel)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            print(f"Request failed ({e}). Retrying in {backoff}s")
+            rate_limiter.back_off(backoff)
+            continue
+        if result.status_code == 429:
+            retry_after = float(result.headers.get("Retry-After", backoff))
+            print(f"Rate limited. Retrying in {retry_after}s")
+            rate_limiter.back_off(retry_after)
+            continue
+        if result.status_code >= 500:
+            print(f"Request failed ({result.status_code}). Retrying in {backoff}s")
+            rate_limiter.back_off(backoff)
+            continue
+        result.raise_for_status()
+        response_data = result.json()
+        if not response_data["ok"]:
+            raise ValueError(f"Slack returned an error: {response_data['error']}")
+        return response_data
+    raise HTTPError(f"Giving up on {channel} after {MAX_ATTEMPTS} attempts")
+
+
+def download_data(
+    access_token, channel, oldest=0, latest=None, session=None, rate_limiter=None
+):
+    # Yields one page of messages at a time, newest first
+    session = session or get_session()
+    rate_limiter = rate_limiter or RateLimiter(HISTORY_REQUESTS_PER_MINUTE)
+    latest = latest or str(time.time())
     has_more = True
     while has_more:
         utc_timestamp = datetime.datetime.utcfromtimestamp(
             float(latest)
         ) + datetime.timedelta(hours=-5)
-        print(utc_timestamp)
-        result = get_page_history(access_token, latest, oldest, channel)
-        try:
-            result.raise_for_status()
-        except HTTPError:
-            print("Request failed. Retrying")
-        response_data = result.json()
-        messages += response_data["messages"]
+        print(f"{channel} {utc_timestamp}")
+        response_data = _get_page_with_retries(
+            session, rate_limiter, access_token, latest, oldest, channel
+        )
+        messages = response_data["messages"]
+        if not messages:
+            break
+        yield messages
         latest = messages[-1]["ts"]
         has_more = response_data["has_more"]
-        time.sleep(2)
-    return messages
+
+
+def _load_export_state():
+    try:
+        with open(EXPORT_STATE_FILE) as infile:
+            return json.load(infile)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_export_state(state):
+    with open(EXPORT_STATE_FILE, "w") as outfile:
+        outfile.write(json.dumps(state, indent=4))
+
+
+def _download_to_file(history_file, pages, message_filter=None):
+    newest_ts = None
+    message_count = 0
+    with open_archive(history_file, "wt") as outfile:
+        for page in pages:
+            # Filtered or not, everything up to here has been looked at
+            newest_ts = newest_ts or page[0]["ts"]
+            if message_filter:
+                page = apply_filter(message_filter, page)
+            message_count += len(page)
+            write_messages(outfile, page)
+    return newest_ts, message_count
+
+
+def _time_slices(oldest, latest, slices):
+    width = (latest - oldest) / slices
+    # Newest slice first, the same order slack pages in
+    return [
+        (str(oldest + width * i), str(oldest + width * (i + 1)))
+        for i in reversed(range(slices))
+    ]
+
+
+def export_channel(
+    channel,
+    history_file,
+    access_token,
+    session,
+    rate_limiter,
+    oldest=0,
+    slices=1,
+    append=False,
+    message_filter=None,
+):
+    # Pages are written to a slice file as they arrive, each time slice paged
+    # concurrently into its own. Only once every slice is complete are they
+    # added to the archive, an incremental run appends them. Compressed
+    # archives can be concatenated as is so the slices are merged byte for byte
+    if slices == 1:
+        bounds = [(oldest, None)]
+    else:
+        bounds = _time_slices(float(oldest), time.time(), slices)
+    slice_files = [f"slice{i}_{history_file}" for i in range(slices)]
+    try:
+        with ThreadPoolExecutor(max_workers=slices) as executor:
+            results = list(
+                executor.map(
+                    lambda slice_file, bounds: _download_to_file(
+                        slice_file,
+                        download_data(
+                            access_token, channel, *bounds, session, rate_limiter
+                        ),
+                        message_filter,
+                    ),
+                    slice_files,
+                    bounds,
+                )
+            )
+        with open(history_file, "ab" if append else "wb") as outfile:
+            for slice_file in slice_files:
+                with open(slice_file, "rb") as infile:
+                    shutil.copyfileobj(infile, outfile)
+    finally:
+        # A failed export leaves the archive as the last complete one
+        for slice_file in slice_files:
+            if os.path.exists(slice_file):
+                os.remove(slice_file)
+    newest_ts = next((ts for ts, _ in results if ts), None)
+    return newest_ts, sum(count for _, count in results)
+
+
+def _parse_date(value):
+    return (
+        datetime.datetime.fromisoformat(value)
+        .replace(tzinfo=datetime.timezone.utc)
+        .timestamp()
+    )
 
 
 def _get_args():
     parser = argparse.ArgumentParser()
     parser.add_argument(
-        "channel", choices=CHANNELS_IDS.keys(), help="Which slack channel?"
+        "channels",
+        nargs="+",
+        choices=[*CHANNELS_IDS.keys(), "all"],
+        help="Which slack channels? all exports every channel concurrently",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only fetch messages newer than the last export and add them to it",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=["gzip", "zstd"],
+        help="Compress the archive. zstd needs the zstandard package",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--since",
+        type=_parse_date,
+        help="Only export messages after this UTC date, e.g. 2020-01-01",
+    )
+    parser.add_argument(
+        "--slices",
+        type=int,
+        default=1,
+        help="Split each channel into this many time windows paged in parallel. "
+        "Needs --since or an incremental export to know where to start",
+    )
+    parser.add_argument(
+        "--filter",
+        choices=MESSAGE_FILTERS.keys(),
+        help="Only keep the messages and fields this consumer needs. "
+        "Filtered archives are named after the filter",
+    )
+    parser.add_argument(
+        "--reauthorize",
+        action="store_true",
+        help=f"Ignore the token cached in {TOKEN_CACHE_FILE}",
+    )
+    args = parser.parse_args()
+    if "all" in args.channels:
+        args.channels = list(CHANNELS_IDS.keys())
+    return args
 
 
 def main():
     args = _get_args()
-    access_token = authorize_app()
-    messages = download_data(access_token, CHANNELS_IDS[args.channel])
-    with open(f"{args.channel}_channel_history.json", "w") as outfile:
-        outfile.write(json.dumps(messages, indent=4))
+    state = _load_export_state()
+    access_token = get_access_token(args.reauthorize)
+    # Slack rate limits per method across the workspace, so all channels and
+    # slices share one limiter
+    session = get_session()
+    rate_limiter = RateLimiter(HISTORY_REQUESTS_PER_MINUTE)
+
+    exports = {}
+    failed = []
+    with ThreadPoolExecutor(max_workers=len(args.channels)) as executor:
+        for channel_name in args.channels:
+            history_file = archive_path(channel_name, args.compress, args.filter)
+            oldest = args.since or 0
+            append = (
+                args.incremental
+                and history_file in state
+                and os.path.exists(history_file)
+            )
+            if append:
+                oldest = state[history_file]
+            if args.slices > 1 and not oldest:
+                print(f"No start time for {channel_name}, exporting without slices")
+            export = executor.submit(
+                export_channel,
+                CHANNELS_IDS[channel_name],
+                history_file,
+                access_token,
+                session,
+                rate_limiter,
+                oldest,
+                args.slices if oldest else 1,
+                append,
+                MESSAGE_FILTERS.get(args.filter),
+            )
+            exports[export] = history_file
+
+        # Each archive's state is saved as soon as it is complete so a channel
+        # failing doesn't make the next incremental run repeat the others
+        for export in as_completed(exports):
+            history_file = exports[export]
+            try:
+                newest_ts, message_count = export.result()
+            except (requests.RequestException, ValueError) as e:
+                print(f"Export to {history_file} failed, it is unchanged: {e}")
+                failed.append(history_file)
+                continue
+            print(f"Downloaded {message_count} messages to {history_file}")
+            if newest_ts:
+                state[history_file] = newest_ts
+                _save_export_state(state)
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,69 @@
+from collections import namedtuple
+
+# keep decides whether a message is exported, project trims it down to the
+# fields its consumer reads while keeping the original shape
+MessageFilter = namedtuple("MessageFilter", ["keep", "project"])
+
+# Same bot release_metrics/extract_releases.py looks for
+JENKINS_BOT_ID = "BNJDGC42C"
+
+
+def _release_field(message):
+    # The field with the release link, None when the message has no fields
+    attachments = message.get("attachments") or [{}]
+    fields = attachments[0].get("fields") or [{}]
+    return fields[0] if "value" in fields[0] else None
+
+
+def _is_jenkins_release(message):
+    # Without the field there is nothing to extract a release from
+    return (
+        message.get("bot_id") == JENKINS_BOT_ID
+        and message.get("subtype") == "bot_message"
+        and _release_field(message) is not None
+    )
+
+
+def _project_jenkins_release(message):
+    field = _release_field(message)
+    return {
+        "ts": message["ts"],
+        "bot_id": message["bot_id"],
+        "subtype": message["subtype"],
+        "attachments": [{"fields": [{"value": field["value"]}]}],
+    }
+
+
+def _is_booking_failure(message):
+    # Sumo Logic alerts are not booking failures, see the booking errors notebook
+    return (
+        message.get("subtype") == "bot_message"
+        and message.get("username") != "Sumo Logic"
+        and bool(message.get("attachments"))
+    )
+
+
+def _project_booking_failure(message):
+    return {
+        "ts": message["ts"],
+        "subtype": message["subtype"],
+        "username": message.get("username"),
+        "attachments": [
+            {"text": attachment.get("text", "")}
+            for attachment in message["attachments"]
+        ],
+    }
+
+
+MESSAGE_FILTERS = {
+    "jenkins": MessageFilter(_is_jenkins_release, _project_jenkins_release),
+    "booking_failures": MessageFilter(_is_booking_failure, _project_booking_failure),
+}
+
+
+def apply_filter(message_filter, messages):
+    return [
+        message_filter.project(message)
+        for message in messages
+        if message_filter.keep(message)
+    ]
@@ -0,0 +1,55 @@
+import gzip
+import io
+import json
+
+try:
+    # Only needed for .zst archives
+    import zstandard  # type: ignore
+except ImportError:
+    zstandard = None
+
+COMPRESSION_SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+
+def archive_path(channel, compression=None, message_filter=None):
+    name = f"{channel}_channel_history"
+    if message_filter:
+        name += f".{message_filter}"
+    return f"{name}.jsonl{COMPRESSION_SUFFIXES[compression]}"
+
+
+def open_archive(path, mode="rt", fileobj=None):
+    # With fileobj the archive is read from that already open binary file and
+    # path only decides the compression
+    if path.endswith(".gz"):
+        return gzip.open(fileobj or path, mode)
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise ValueError("Install zstandard to read or write .zst archives")
+        return zstandard.open(fileobj or path, mode)
+    if fileobj is not None:
+        return io.TextIOWrapper(fileobj) if "t" in mode else fileobj
+    return open(path, mode)
+
+
+def write_messages(outfile, messages):
+    for message in messages:
+        outfile.write(json.dumps(message))
+        outfile.write("\n")
+
+
+def iter_messages(path, offset=0):
+    # Every export run appends its messages newest first, sort on ts if the
+    # overall order matters. Each run also appends whole gzip members or zstd
+    # frames, so passing the size the file had before a run (a byte offset)
+    # reads only the messages that run added
+    if path.endswith(".json"):
+        # Exports from before the jsonl format are a single json list
+        with open(path) as infile:
+            yield from json.load(infile)
+        return
+    with open(path, "rb") as raw:
+        raw.seek(offset)
+        with open_archive(path, "rt", raw) as infile:
+            for line in infile:
+                yield json.loads(line)